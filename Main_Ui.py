@@ -1,14 +1,20 @@
 import streamlit as st
 import os
-import json
 import base64
-import numpy as np
-import pandas as pd
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-import joblib
-from PIL import Image
-from crop_labels import crop_labels
+# Heavy libraries (TensorFlow, pandas, PIL, joblib) are imported lazily by the
+# tool that needs them, so the crop page never pays for TensorFlow
+import model_registry
+import startup_report
+from timing import StageTimer, DISEASE_STAGES, CROP_STAGES
+import inference
+import micro_batcher
+import result_cache
+import similarity_index
+import crop_recommender
+import uploads
+import label_index
+import metrics
+import worker_pool
 
 # Page configuration
 st.set_page_config(
@@ -226,48 +232,20 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
 # Model paths
-disease_model_path = 'plant_disease.keras'
-crop_model_path = 'model.pkl'
+disease_model_path = model_registry.DISEASE_MODEL_PATH
+crop_model_path = model_registry.CROP_MODEL_PATH
 disease_model_exists = os.path.exists(disease_model_path)
 crop_model_exists = os.path.exists(crop_model_path)
 
-# Remedies
-remedies_dict = {}
+# Compiled class/remedy index, built once per process
+label_error = None
 try:
-    with open('remedies.json', 'r') as f:
-        remedies_dict = json.load(f)
-except FileNotFoundError:
-    st.warning("⚠️ remedies.json not found. Remedies may be unavailable.")
+    label_index.get_label_index()
+except (FileNotFoundError, label_index.LabelIndexError) as e:
+    label_error = e
 
-# Class labels
-class_names = [
-    "Apple__Apple_scab", "Apple__Black_rot", "Apple__Cedar_apple_rust", "Apple__healthy",
-    "Blueberry__healthy", "Cherry_(including_sour)__Powdery_mildew", "Cherry_(including_sour)__healthy",
-    "Corn_(maize)__Cercospora_leaf_spot Gray_leaf_spot", "Corn_(maize)__Common_rust_",
-    "Corn_(maize)__Northern_Leaf_Blight", "Corn_(maize)__healthy", "Grape__Black_rot",
-    "Grape__Esca_(Black_Measles)", "Grape__Leaf_blight_(Isariopsis_Leaf_Spot)", "Grape__healthy",
-    "Orange__Haunglongbing_(Citrus_greening)", "Peach__Bacterial_spot", "Peach__healthy",
-    "Pepper,_bell__Bacterial_spot", "Pepper,_bell__healthy", "Potato__Early_blight",
-    "Potato__Late_blight", "Potato__healthy", "Raspberry__healthy", "Soybean__healthy",
-    "Squash__Powdery_mildew", "Strawberry__Leaf_scorch", "Strawberry__healthy",
-    "Tomato__Bacterial_spot", "Tomato__Early_blight", "Tomato__Late_blight",
-    "Tomato__Leaf_Mold", "Tomato__Septoria_leaf_spot",
-    "Tomato__Spider_mites Two-spotted_spider_mite", "Tomato__Target_Spot",
-    "Tomato__Tomato_Yellow_Leaf_Curl_Virus", "Tomato__Tomato_mosaic_virus", "Tomato__healthy"
-]
-
-# Format disease name for better readability
-def format_disease_name(disease_name):
-    parts = disease_name.split('__')
-    plant = parts[0].replace('_', ' ')
-    
-    if len(parts) > 1:
-        condition = parts[1].replace('_', ' ')
-        if condition.lower() == 'healthy':
-            return f"{plant} (Healthy)"
-        else:
-            return f"{plant}: {condition}"
-    return disease_name
+# Prometheus scrape endpoint for this server process (METRICS_PORT, 0 disables)
+metrics.start_http_server()
 
 # Main content area
 display_header()
@@ -284,10 +262,26 @@ if model_type.startswith("🩺"):
     """, unsafe_allow_html=True)
     
     if not disease_model_exists:
-        st.error("⚠️ Disease model not found! Please add 'plant_disease.keras'.")
+        st.error(f"⚠️ Disease model not found! Please add '{disease_model_path}'.")
+    elif label_error:
+        st.error(f"⚠️ Disease labels could not be loaded: {label_error}")
     else:
         try:
-            model = load_model(disease_model_path)
+            pool = worker_pool.get_worker_pool()
+            if pool is not None:
+                # Decode and predict in worker processes; this process never loads the model
+                model = predictor = pool
+                model_version = pool.model_version
+            else:
+                disease_entry = model_registry.get_disease_entry(disease_model_path)
+                model, model_version = disease_entry.model, disease_entry.version
+                # Shared batcher coalesces concurrent sessions into one forward pass
+                predictor = micro_batcher.get_disease_batcher()
+            # Past cases for "Similar Diseases"; needs the Keras model's embeddings in this process
+            similar_index = similarity_index.get_similarity_index(model_version) if pool is None else None
+            if similar_index is not None:
+                predictor = similarity_index.get_embedding_batcher()
+            diagnosis_cache = result_cache.get_diagnosis_cache()
             
             # Single column image upload layout
             st.markdown("### Upload Leaf Image")
@@ -304,30 +298,40 @@ if model_type.startswith("🩺"):
                 </div>
             """, unsafe_allow_html=True)
             
-            if uploaded_file:
-                img = Image.open(uploaded_file).convert("RGB")
+            # Reject oversized or malformed uploads from the header, before decoding
+            upload_data = uploaded_file.getvalue() if uploaded_file else None
+            upload_error = None
+            if upload_data is not None:
+                try:
+                    uploads.check_upload(upload_data)
+                except uploads.UploadRejected as e:
+                    upload_error = str(e)
+            
+            if upload_error:
+                st.error(f"⚠️ {upload_error}")
+            elif uploaded_file:
+                timer = StageTimer("diagnose", DISEASE_STAGES)
                 st.markdown("### Image Preview")
-                st.image(img, use_container_width =True, caption="Uploaded Leaf Image")
+                st.image(uploads.preview_thumbnail(upload_data), use_container_width =True, caption="Uploaded Leaf Image")
                 
                 analyze_button = st.button("🔍 Analyze Image", use_container_width=True)
                 
                 if analyze_button:
                     with st.spinner("🧬 Analyzing leaf pattern..."):
-                        # Progress bar for better UX during processing
-                        progress_bar = st.progress(0)
-                        for i in range(100):
-                            # Simulate processing time
-                            import time
-                            time.sleep(0.01)
-                            progress_bar.progress(i + 1)
+                        # Progress bar driven by the real pipeline stages
+                        progress_bar = st.progress(timer.progress)
+                        timer.on_stage = lambda name, done: progress_bar.progress(done, text=f"{name} ✓")
                         
-                        # Actual prediction
-                        img = img.resize((224, 224))
-                        img_array = image.img_to_array(img)
-                        img_array = np.expand_dims(img_array, axis=0) / 255.0
-                        
-                        prediction = model.predict(img_array)
-                        predicted_class = class_names[np.argmax(prediction)]
+                        with metrics.track_request("diagnose", timer) as request_log:
+                            diagnosis = inference.diagnose_upload(
+                                predictor, upload_data,
+                                cache=diagnosis_cache, model_version=model_version,
+                                timer=timer, index=similar_index
+                            )
+                            request_log.update(prediction=diagnosis["class"], cached=diagnosis["cached"],
+                                               near_duplicate=diagnosis.get("near_duplicate", False),
+                                               confidence=round(diagnosis["confidence"], 4))
+                        remedy = diagnosis["remedy"]
                         
                         # Clear progress bar after completion
                         progress_bar.empty()
@@ -338,11 +342,9 @@ if model_type.startswith("🩺"):
                                 <h3 style="margin-top: 0;">Diagnosis Results</h3>
                                 <p><strong>Identified Condition:</strong> {}</p>
                             </div>
-                        """.format(format_disease_name(predicted_class)), unsafe_allow_html=True)
+                        """.format(diagnosis["condition"]), unsafe_allow_html=True)
                         
                         # Show remedies if available
-                        remedy = remedies_dict.get(predicted_class, "No specific remedy available for this condition.")
-                        
                         st.markdown("""
                             <div class="remedy-card">
                                 <h3 style="margin-top: 0;">🌱 Treatment Recommendations</h3>
@@ -350,6 +352,14 @@ if model_type.startswith("🩺"):
                             </div>
                         """.format(remedy), unsafe_allow_html=True)
                         
+                        with st.expander("⏱️ Processing time"):
+                            if diagnosis.get("near_duplicate"):
+                                st.caption("⚡ Near-duplicate of an earlier upload; answered from the similarity index")
+                            elif diagnosis["cached"]:
+                                st.caption("⚡ Served from the diagnosis cache")
+                            st.table(timer.as_rows())
+                            st.json(diagnosis_cache.stats())
+                        
                         # Related resources
                         st.markdown("### 📚 Related Resources")
                         resource_col1, resource_col2 = st.columns(2)
@@ -368,17 +378,24 @@ if model_type.startswith("🩺"):
                             """, unsafe_allow_html=True)
                             
                         with resource_col2:
+                            similar_cases = diagnosis.get("similar_cases")
+                            if similar_cases:
+                                similar_intro = "Closest past diagnoses to this photo:"
+                                similar_items = "".join(
+                                    f"<li>{case['condition']} ({case['similarity']:.0%} similar)</li>"
+                                    for case in similar_cases)
+                            else:
+                                similar_intro = "Other conditions with similar symptoms that might require different treatments:"
+                                similar_items = "".join(f"<li>{item}</li>" for item in (
+                                    "Nutrient deficiencies", "Environmental stress",
+                                    "Related fungal/bacterial infections"))
                             st.markdown("""
                                 <div style="padding: 15px; border-radius: 10px; border: 1px solid #E0E0E0;">
                                     <h4 style="margin-top: 0; color: #2E7D32;">🔎 Similar Diseases</h4>
-                                    <p>Other conditions with similar symptoms that might require different treatments:</p>
-                                    <ul>
-                                        <li>Nutrient deficiencies</li>
-                                        <li>Environmental stress</li>
-                                        <li>Related fungal/bacterial infections</li>
-                                    </ul>
+                                    <p>{}</p>
+                                    <ul>{}</ul>
                                 </div>
-                            """, unsafe_allow_html=True)
+                            """.format(similar_intro, similar_items), unsafe_allow_html=True)
             else:
                 st.markdown("""
                     <div style="background-color: #F5F5F5; border-radius: 10px; padding: 40px 20px; text-align: center;">
@@ -386,9 +403,43 @@ if model_type.startswith("🩺"):
                         <p style="color: #212121;">Upload a photo of your plant to get started</p>
                     </div>
                 """, unsafe_allow_html=True)
+            
+            # Batch mode for field visits with many photos
+            with st.expander("📦 Batch Diagnosis (multiple images)"):
+                batch_files = st.file_uploader(
+                    "Choose images...",
+                    type=["jpg", "jpeg", "png"],
+                    accept_multiple_files=True,
+                    key="batch_uploader",
+                    help="Upload all the leaf photos from a field visit at once"
+                )
+                batch_size = st.select_slider("Batch size", options=[1, 4, 8, 16, 32, 64],
+                                              value=inference.DEFAULT_BATCH_SIZE)
+                
+                if batch_files and st.button("🔍 Analyze All Images", use_container_width=True):
+                    accepted_files = []
+                    for batch_file in batch_files:
+                        try:
+                            uploads.check_upload(batch_file.getvalue())
+                            accepted_files.append(batch_file)
+                        except uploads.UploadRejected as e:
+                            st.warning(f"⚠️ Skipped {batch_file.name}: {e}")
                     
+                    with st.spinner(f"🧬 Analyzing {len(accepted_files)} images..."):
+                        with metrics.track_request("diagnose_batch", images=len(accepted_files)) as request_log:
+                            batch_results = inference.diagnose_images(
+                                model, accepted_files, batch_size=batch_size,
+                                cache=diagnosis_cache, model_version=model_version
+                            )
+                            request_log["prediction"] = [r["class"] for r in batch_results]
+                    st.dataframe(batch_results, use_container_width=True)
+                    
+        except worker_pool.PoolBusy:
+            st.warning("⏳ All inference workers are busy right now. Please try again in a moment.")
         except Exception as e:
-            st.error(f"Error: {e}")
+            reference = metrics.record_exception("disease page", e)
+            st.error(f"⚠️ Something went wrong while diagnosing ({type(e).__name__}). "
+                     f"Please try again; reference {reference} is in the server log.")
 
 # Crop Recommendation
 elif model_type.startswith("🌾"):
@@ -405,7 +456,7 @@ elif model_type.startswith("🌾"):
         st.error("⚠️ Crop recommendation model not found! Please add 'model.pkl'.")
     else:
         try:
-            crop_model = joblib.load(crop_model_path)
+            recommender = crop_recommender.get_crop_recommender(crop_model_path)
             
             st.markdown("### Enter Your Farm Parameters")
             
@@ -460,29 +511,28 @@ elif model_type.startswith("🌾"):
             
             if predict_button:
                 with st.spinner("Analyzing farm parameters..."):
-                    # Progress bar for better UX
+                    # Progress bar driven by the real pipeline stages
                     progress_bar = st.progress(0)
-                    for i in range(100):
-                        # Simulate processing time
-                        import time
-                        time.sleep(0.01)
-                        progress_bar.progress(i + 1)
+                    timer = StageTimer("recommend", CROP_STAGES,
+                                       on_stage=lambda name, done: progress_bar.progress(done, text=f"{name} ✓"))
                     
-                    input_data = pd.DataFrame({
-                        'N': [N], 'P': [P], 'K': [K],
-                        'temperature': [temp],
-                        'humidity': [humidity],
-                        'ph': [ph],
-                        'rainfall': [rainfall]
-                    })
+                    with metrics.track_request("recommend", timer) as request_log:
+                        recommendation = recommender.recommend({
+                            'N': N, 'P': P, 'K': K,
+                            'temperature': temp,
+                            'humidity': humidity,
+                            'ph': ph,
+                            'rainfall': rainfall
+                        }, timer)
+                        request_log.update(prediction=recommendation["crop"],
+                                           probability=round(recommendation["probability"], 4))
+                    crop_name = recommendation["crop"]
+                    # Softmaxed decision scores (e.g. an SVC without probability=True) only rank crops
+                    calibrated = inference.has_probabilities(recommender.model)
                     
                     # Clear progress bar after completion
                     progress_bar.empty()
                     
-                    result = crop_model.predict(input_data)
-                    crop_index = int(result[0])
-                    crop_name = crop_labels[crop_index]
-                    
                     # Display recommendation with images and info
                     st.markdown("""
                         <div class="result-card">
@@ -493,11 +543,13 @@ elif model_type.startswith("🌾"):
                                     <p style="font-size: 1.5rem; font-weight: 600; margin-bottom: 5px; color: #2E7D32;">
                                         {crop_name}
                                     </p>
-                                    <p>Best match for your soil and climate conditions</p>
+                                    <p>Best match for your soil and climate conditions{probability}</p>
                                 </div>
                             </div>
                         </div>
-                    """.replace("{crop_name}", crop_name.capitalize()), unsafe_allow_html=True)
+                    """.replace("{crop_name}", crop_name.capitalize())
+                        .replace("{probability}", f" ({recommendation['probability']:.0%})" if calibrated else ""),
+                        unsafe_allow_html=True)
                     
                     # Additional crop information
                     st.markdown("### Crop Information")
@@ -530,37 +582,32 @@ elif model_type.startswith("🌾"):
                     
                     # Alternative crops
                     st.markdown("### Alternative Options")
-                    alt_col1, alt_col2, alt_col3 = st.columns(3)
+                    alternatives = recommendation["alternatives"]
+                    for rank, (alt_col, alternative) in enumerate(
+                            zip(st.columns(max(len(alternatives), 1)), alternatives), 2):
+                        compatibility = (f"Compatibility: {alternative['probability']:.0%}" if calibrated
+                                         else f"Option #{rank}")
+                        with alt_col:
+                            st.markdown("""
+                                <div style="text-align: center; padding: 15px; border-radius: 10px; border: 1px solid #E0E0E0;">
+                                    <div style="font-size: 2rem;">🌱</div>
+                                    <p style="font-weight: 600; color: #2E7D32;">{}</p>
+                                    <p>{}</p>
+                                </div>
+                            """.format(alternative["crop"].capitalize(), compatibility), unsafe_allow_html=True)
                     
-                    with alt_col1:
-                        st.markdown("""
-                            <div style="text-align: center; padding: 15px; border-radius: 10px; border: 1px solid #E0E0E0;">
-                                <div style="font-size: 2rem;">🌽</div>
-                                <p style="font-weight: 600; color: #2E7D32;">Corn</p>
-                                <p>Compatibility: 80%</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                    with alt_col2:
-                        st.markdown("""
-                            <div style="text-align: center; padding: 15px; border-radius: 10px; border: 1px solid #E0E0E0;">
-                                <div style="font-size: 2rem;">🍅</div>
-                                <p style="font-weight: 600; color: #2E7D32;">Tomato</p>
-                                <p>Compatibility: 75%</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                    with alt_col3:
-                        st.markdown("""
-                            <div style="text-align: center; padding: 15px; border-radius: 10px; border: 1px solid #E0E0E0;">
-                                <div style="font-size: 2rem;">🥔</div>
-                                <p style="font-weight: 600; color: #2E7D32;">Potato</p>
-                                <p>Compatibility: 70%</p>
-                            </div>
-                        """, unsafe_allow_html=True)
+                    with st.expander("⏱️ Processing time"):
+                        st.table(timer.as_rows())
                 
         except Exception as e:
-            st.error(f"Error loading crop model: {e}")
+            reference = metrics.record_exception("crop page", e)
+            st.error(f"⚠️ Something went wrong with the crop recommendation ({type(e).__name__}). "
+                     f"Please try again; reference {reference} is in the server log.")
+
+# Startup cost breakdown for this server process
+with st.sidebar:
+    with st.expander("⚙️ Startup report"):
+        st.json(startup_report.report())
 
 # Footer
 st.markdown("""
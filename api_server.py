@@ -0,0 +1,222 @@
+"""Headless HTTP API for the AgriRevolt models.
+
+Runs alongside the Streamlit UI and shares its prediction code (inference.py)
+and model loading (model_registry.py):
+
+    python api_server.py --host 0.0.0.0 --port 8080
+
+Endpoints:
+    GET  /health          -> loaded model versions
+    GET  /metrics         -> Prometheus text format (see metrics.py)
+    POST /diagnose        -> multipart "image" file(s), or JSON {"image": <base64>}
+                             / {"images": [<base64>, ...]}
+    POST /recommend-crop  -> JSON or form fields N, P, K, temperature, humidity, ph, rainfall,
+                             or JSON {"rows": [[N, P, K, ...], ...] or [{...}, ...], "k": 4}
+                             for top-k recommendations of many farms at once
+"""
+import argparse
+import asyncio
+import base64
+import io
+import logging
+
+from aiohttp import web
+
+import crop_recommender
+import inference
+import label_index
+import metrics
+import micro_batcher
+import model_registry
+import result_cache
+import uploads
+import worker_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _bad_request(message):
+    return web.json_response({"error": message}, status=400)
+
+
+@web.middleware
+async def observe(request, handler):
+    # Every request is counted, timed and logged as one JSON line; handlers add
+    # their predictions to request["request_log"]
+    resource = request.match_info.route.resource
+    tool = resource.canonical if resource is not None else "unmatched"
+    http_error = None
+    with metrics.track_request(tool, method=request.method) as record:
+        request["request_log"] = record
+        try:
+            response = await handler(request)
+            status = response.status
+        except web.HTTPException as e:
+            http_error, status = e, e.status
+        record["http_status"] = status
+        if status >= 400:
+            record["status"] = "rejected" if status < 500 else "error"
+    if http_error is not None:
+        raise http_error
+    return response
+
+
+async def _read_json_object(request):
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError(f"expected a JSON object, got {type(body).__name__}")
+    return body
+
+
+async def _read_images(request):
+    # Returns a list of (name, file-like) pairs from a multipart or JSON body
+    images = []
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name in ("image", "images"):
+                data = await part.read()
+                images.append((part.filename or part.name, io.BytesIO(data)))
+    else:
+        body = await _read_json_object(request)
+        encoded = body.get("images") or ([body["image"]] if "image" in body else [])
+        for i, item in enumerate(encoded):
+            images.append((f"image-{i}", io.BytesIO(base64.b64decode(item))))
+    return images
+
+
+async def _read_features(request):
+    if request.content_type == "application/json":
+        return await _read_json_object(request)
+    return dict(await request.post())
+
+
+async def health(request):
+    entries = model_registry.loaded_entries()
+    return web.json_response({
+        "status": "ok",
+        "models": {path: entry.version for path, entry in entries.items()},
+        "disease_batcher": micro_batcher.get_disease_batcher().stats(),
+        "diagnosis_cache": result_cache.get_diagnosis_cache().stats(),
+        "worker_pool": pool.stats() if (pool := worker_pool.get_worker_pool()) else None,
+    })
+
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def diagnose(request):
+    try:
+        images = await _read_images(request)
+    except (ValueError, KeyError, TypeError) as e:
+        return _bad_request(f"Invalid request body: {e}")
+    if not images:
+        return _bad_request("No image provided")
+    for name, source in images:
+        try:
+            uploads.check_upload(source.getvalue())
+        except uploads.UploadRejected as e:
+            return _bad_request(f"{name}: {e}")
+
+    names = [name for name, _ in images]
+    sources = [source for _, source in images]
+
+    def run():
+        pool = worker_pool.get_worker_pool()
+        if pool is not None:
+            model, version = pool, pool.model_version
+        else:
+            # Requests are coalesced with concurrent ones by the shared micro-batcher
+            model = micro_batcher.get_disease_batcher()
+            version = model_registry.get_disease_entry().version
+        return inference.diagnose_images(model, sources, names=names,
+                                         cache=result_cache.get_diagnosis_cache(),
+                                         model_version=version)
+
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(None, run)
+    except OSError as e:
+        # PIL's UnidentifiedImageError, and truncated files that pass the header check;
+        # filesystem errors (e.g. a missing model file) carry an errno and stay 500s
+        if e.errno is not None:
+            raise
+        return _bad_request(f"Could not decode image: {e}")
+    except worker_pool.PoolBusy as e:
+        return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+    request["request_log"]["prediction"] = [r["class"] for r in results]
+    return web.json_response({"results": results})
+
+
+async def recommend_crop(request):
+    try:
+        features = await _read_features(request)
+        if "rows" in features:
+            # Many farms at once: one predict_proba call for the whole matrix
+            rows = features["rows"]
+            k = int(features.get("k", inference.DEFAULT_TOP_K))
+            if not rows:
+                raise ValueError("rows must not be empty")
+            if k < 1:
+                raise ValueError("k must be at least 1")
+            inference.build_crop_rows(rows)
+        else:
+            inference.build_crop_input(features)
+    except (ValueError, TypeError) as e:
+        return _bad_request(str(e))
+
+    def run():
+        # "calibrated" is false when the probabilities are softmaxed decision scores
+        if "rows" in features:
+            model = model_registry.get_crop_model()
+            return {"results": inference.recommend_crops(model, rows, k),
+                    "calibrated": inference.has_probabilities(model)}
+        recommender = crop_recommender.get_crop_recommender()
+        return dict(recommender.recommend(features), calibrated=inference.has_probabilities(recommender.model))
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, run)
+    request["request_log"]["prediction"] = [r["crop"] for r in result.get("results", [result])]
+    return web.json_response(result)
+
+
+async def _warm_models(app):
+    # Load models before accepting traffic so the first request is not a cold one;
+    # an inconsistent remedies.json / class list fails startup here
+    label_index.get_label_index()
+    loop = asyncio.get_running_loop()
+    pool = worker_pool.get_worker_pool()
+    # With a worker pool the disease model lives in the workers only
+    await loop.run_in_executor(None, model_registry.warm_all, pool is None)
+    if pool is not None:
+        await loop.run_in_executor(None, pool.warm)
+
+
+def create_app():
+    app = web.Application(client_max_size=32 * 1024 * 1024, middlewares=[observe])
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_post("/diagnose", diagnose)
+    app.router.add_post("/recommend-crop", recommend_crop)
+    app.on_startup.append(_warm_models)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgriRevolt inference API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=micro_batcher.DEFAULT_MAX_BATCH_SIZE,
+                        help="Largest batch the disease micro-batcher will form")
+    parser.add_argument("--max-wait-ms", type=float, default=micro_batcher.DEFAULT_MAX_WAIT_MS,
+                        help="How long the micro-batcher waits to fill a batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    micro_batcher.get_disease_batcher(args.max_batch_size, args.max_wait_ms)
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
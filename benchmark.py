@@ -0,0 +1,235 @@
+"""Reproducible latency/throughput benchmark for both tools.
+
+Uses synthetic JPEG leaf photos and synthetic farm rows (fixed seed), and
+reports p50/p95/p99 latency per pipeline stage and end to end, throughput at
+batch sizes 1-64, peak RSS and cold-start time, as JSON so runs can be compared
+across model formats and commits. With ``--tool all`` each tool is measured in
+its own process, so each peak RSS covers only that tool:
+
+    python benchmark.py --output bench.json
+    DISEASE_MODEL_BACKEND=tflite-int8 python benchmark.py --tool disease --output bench-int8.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import inference
+import model_registry
+import preprocessing
+from model_registry import CROP_FEATURES
+from timing import StageTimer
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+# Photo sizes: a typical web upload and a 12 MP phone camera shot
+IMAGE_SIZES = {'1024x768': (1024, 768), '4000x3000': (4000, 3000)}
+# Slider ranges of the crop form
+CROP_RANGES = {'N': (0, 150), 'P': (0, 150), 'K': (0, 200), 'temperature': (0, 50),
+               'humidity': (0, 100), 'ph': (0, 14), 'rainfall': (0, 3000)}
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+        'samples': len(ms),
+    }
+
+
+def _timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def synthetic_jpeg(width, height, rng):
+    # Smooth gradients plus noise, so JPEG size and decode cost resemble a photo
+    Image = preprocessing.pil_image()
+    y, x = np.mgrid[0:1:height * 1j, 0:1:width * 1j].astype(np.float32)
+    base = np.stack([x * 120 + 40, y * 160 + 30, (x + y) * 50 + 20], axis=2)
+    noise = rng.normal(0, 12, (height, width, 1)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+def synthetic_farm_rows(count, rng):
+    return np.column_stack([rng.uniform(*CROP_RANGES[c], count) for c in CROP_FEATURES])
+
+
+def bench_disease(model, iterations, rng):
+    result = {'images': {}, 'throughput': {}}
+    for label, (width, height) in IMAGE_SIZES.items():
+        data = synthetic_jpeg(width, height, rng)
+        stages = {}
+        end_to_end = []
+        for _ in range(iterations):
+            timer = StageTimer('benchmark')
+            start = time.perf_counter()
+            inference.diagnose_upload(model, data, timer=timer)
+            end_to_end.append(time.perf_counter() - start)
+            for stage, seconds in timer.durations.items():
+                stages.setdefault(stage, []).append(seconds)
+        result['images'][label] = {
+            'bytes': len(data),
+            'end_to_end': latency_summary(end_to_end),
+            'stages': {stage: latency_summary(s) for stage, s in stages.items()},
+        }
+
+    batch = preprocessing.new_batch(max(BATCH_SIZES))
+    batch[...] = rng.integers(0, 256, batch.shape)
+    preprocessing.scale_inplace(batch)
+    for size in BATCH_SIZES:
+        samples = _timed(lambda: model.predict(batch[:size], verbose=0), iterations)
+        result['throughput'][size] = {
+            'predict': latency_summary(samples),
+            'images_per_sec': round(size / float(np.median(samples)), 1),
+        }
+    return result
+
+
+def bench_crop(model, iterations, rng):
+    rows = synthetic_farm_rows(max(BATCH_SIZES) * iterations, rng)
+    stages = {}
+    end_to_end = []
+    for row in rows[:iterations]:
+        features = dict(zip(CROP_FEATURES, row))
+        timer = StageTimer('benchmark')
+        start = time.perf_counter()
+        inference.recommend_crop(model, features, timer)
+        end_to_end.append(time.perf_counter() - start)
+        for stage, seconds in timer.durations.items():
+            stages.setdefault(stage, []).append(seconds)
+
+    throughput = {}
+    for size in BATCH_SIZES:
+        # A different slice of rows each iteration
+        samples = []
+        for i in range(iterations):
+            chunk = rows[i * size:(i + 1) * size]
+            start = time.perf_counter()
+            inference.recommend_crops(model, chunk)
+            samples.append(time.perf_counter() - start)
+        throughput[size] = {
+            'recommend': latency_summary(samples),
+            'rows_per_sec': round(size / float(np.median(samples)), 1),
+        }
+    return {
+        'end_to_end': latency_summary(end_to_end),
+        'stages': {stage: latency_summary(s) for stage, s in stages.items()},
+        'throughput': throughput,
+    }
+
+
+def _script(name):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+
+def cold_start(tool):
+    # Fresh interpreter: imports + model load + first inference, as at pod start
+    start = time.perf_counter()
+    run = subprocess.run([sys.executable, _script('startup_report.py'), '--tool', tool],
+                         capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if run.returncode != 0:
+        # Reported rather than raised, so the in-process numbers are still written
+        lines = run.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit status {run.returncode}"}
+    return dict(json.loads(run.stdout), wall_ms=round(wall_ms, 1))
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_tool(tool, iterations, rng, with_cold_start=True):
+    """Report entries for one tool: ``<tool>``, ``<tool>_cold_start`` and ``<tool>_peak_rss_mb``."""
+    path = model_registry.DISEASE_MODEL_PATH if tool == 'disease' else model_registry.CROP_MODEL_PATH
+    if not os.path.exists(path):
+        return {tool: {'skipped': f"{path} not found"}}
+    entries = {}
+    if with_cold_start:
+        entries[f'{tool}_cold_start'] = cold_start(tool)
+    if tool == 'disease':
+        entries[tool] = bench_disease(model_registry.get_disease_model(), iterations, rng)
+    else:
+        entries[tool] = bench_crop(model_registry.get_crop_model(), iterations, rng)
+    entries[f'{tool}_peak_rss_mb'] = peak_rss_mb()
+    return entries
+
+
+def tool_process(tool, args):
+    # One process per tool, so its peak RSS does not include the other tool's runtime and model
+    command = [sys.executable, _script('benchmark.py'), '--tool', tool,
+               '--iterations', str(args.iterations), '--seed', str(args.seed)]
+    if args.no_cold_start:
+        command.append('--no-cold-start')
+    run = subprocess.run(command, capture_output=True, text=True)
+    if run.returncode != 0:
+        # Reported rather than raised, so the other tool's numbers are still written
+        lines = run.stderr.strip().splitlines()
+        return {tool: {'error': lines[-1] if lines else f"exit status {run.returncode}"}}
+    report = json.loads(run.stdout)
+    return {key: value for key, value in report.items() if key.startswith(tool)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the disease and crop pipelines")
+    parser.add_argument('--tool', choices=['crop', 'disease', 'all'], default='all')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-cold-start', action='store_true', help="Skip the fresh-process measurements")
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    tools = ['crop', 'disease'] if args.tool == 'all' else [args.tool]
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'disease_backend': model_registry.DISEASE_MODEL_BACKEND,
+        'iterations': args.iterations,
+    }
+
+    if len(tools) == 1:
+        report.update(bench_tool(tools[0], args.iterations, rng, not args.no_cold_start))
+    else:
+        for tool in tools:
+            report.update(tool_process(tool, args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Parallel, cached model selection for the crop recommender.
+
+    python crop_model_selection.py --data Crop_recommendation.csv --workers 4
+
+Cross-validates every model crop_analysis_and_prediction_.ipynb compared (KNN,
+SVC kernels and the C/gamma grid, trees, boosting, XGBoost and the hybrids) on
+the notebook's training split, and exports the winner as model.pkl:
+
+- The stratified folds and each fold's MinMaxScaler output are computed once
+  and written as .npy files that the worker processes memory-map, instead of
+  every model re-splitting and refitting the scaler.
+- Each (config, fold) result is cached as JSON under --cache-dir, keyed on the
+  estimator's parameters, the data and the fold layout, so a re-run only
+  evaluates configs that are new or changed.
+- Next to accuracy, every config records its fit time, batch prediction time
+  per row and single-row latency. Predictions go through the model as it is
+  served (MinMaxScaler pipeline, DataFrame input), and single rows through one
+  predict_proba call, as the app makes for one farm. SVCs are wrapped in
+  CalibratedClassifierCV so that every exported model has real probabilities.
+  Configs on the accuracy/latency frontier are marked, and
+  --max-latency-ms picks the most accurate config within a latency budget.
+
+The winner is refitted on the whole training split, checked on the holdout and
+saved with its label mapping (model_labels.json) and a selection report.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import MinMaxScaler
+
+import inference
+from crop_labels import crop_labels
+from hybrid_ensemble import HybridCropClassifier
+from model_registry import CROP_FEATURES, CROP_MODEL_PATH
+from train_crop_model import HYBRIDS, load_dataset
+
+DEFAULT_FOLDS = 5
+DEFAULT_SEED = 42
+DEFAULT_CACHE_DIR = 'crop_selection_cache'
+DEFAULT_REPORT = 'crop_selection.json'
+# Part of every cache key; bump when what a fold result measures changes
+CACHE_FORMAT = 2
+# Single-row predictions timed per fold (the median is reported)
+SINGLE_ROW_REPEATS = 25
+
+
+def candidates(seed=DEFAULT_SEED):
+    """Config name -> unfitted estimator, for every model the notebook compared.
+
+    Configs whose library is not installed (XGBoost) are left out.
+    """
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    configs = {f'knn-{k}': KNeighborsClassifier(n_neighbors=k) for k in range(1, 11)}
+    # SVCs are calibrated (Platt scaling on held-out folds); without predict_proba the app
+    # could only show softmaxed decision scores
+    def svc(**params):
+        return CalibratedClassifierCV(SVC(**params), ensemble=False)
+
+    configs.update({f'svc-{kernel}': svc(kernel=kernel) for kernel in ('linear', 'rbf', 'poly')})
+    # The notebook's 36-point grid; gamma only affects non-linear kernels, so it is searched with RBF
+    for C in np.logspace(-3, 2, 6):
+        for gamma in np.logspace(-3, 2, 6):
+            configs[f'svc-rbf-C{C:g}-gamma{gamma:g}'] = svc(kernel='rbf', C=C, gamma=gamma)
+    configs['decision-tree'] = DecisionTreeClassifier(random_state=seed)
+    configs['random-forest'] = RandomForestClassifier(max_depth=4, n_estimators=100, random_state=seed)
+    configs['gradient-boosting'] = GradientBoostingClassifier(random_state=seed)
+    try:
+        import xgboost as xgb
+        configs['xgboost'] = xgb.XGBClassifier(eval_metric='mlogloss', random_state=seed)
+    except ImportError:
+        pass
+    for name, factory in HYBRIDS.items():
+        try:
+            configs[f'hybrid-{name}'] = factory()
+        except ImportError:
+            pass
+    return configs
+
+
+def servable(estimator, scaler=None):
+    """The model as the app serves it: hybrids scale internally, other estimators sit behind a MinMaxScaler.
+
+    ``scaler`` may be an already fitted scaler to put in front of an already fitted estimator.
+    """
+    if isinstance(estimator, HybridCropClassifier):
+        return estimator
+    return make_pipeline(scaler or MinMaxScaler(), estimator)
+
+
+def config_key(estimator, data_key):
+    """Cache key for one config: estimator type and parameters, plus the data and fold layout."""
+    import sklearn
+    params = sorted((name, repr(value)) for name, value in estimator.get_params(deep=True).items())
+    spec = (f'{CACHE_FORMAT}|{type(estimator).__module__}.{type(estimator).__qualname__}|{params}|'
+            f'{data_key}|{sklearn.__version__}')
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def write_folds(X, y, directory, n_folds=DEFAULT_FOLDS, seed=DEFAULT_SEED):
+    """Write the fold layout and per-fold scaled features once; returns the folds directory.
+
+    ``scaled[f]`` is X scaled by a MinMaxScaler fitted on fold f's training rows only.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.int64)
+    digest = hashlib.sha256(X.tobytes() + y.tobytes() + f'{n_folds}|{seed}|{CACHE_FORMAT}'.encode()).hexdigest()[:16]
+    folds_dir = os.path.join(directory, f'folds-{digest}')
+    if os.path.exists(os.path.join(folds_dir, 'scaled.npy')):
+        return folds_dir
+    os.makedirs(folds_dir, exist_ok=True)
+    fold = np.empty(len(y), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    for f, (_, test) in enumerate(splitter.split(X, y)):
+        fold[test] = f
+    scaled = np.stack([MinMaxScaler().fit(X[fold != f]).transform(X) for f in range(n_folds)])
+    np.save(os.path.join(folds_dir, 'X.npy'), X)
+    np.save(os.path.join(folds_dir, 'fold.npy'), fold)
+    np.save(os.path.join(folds_dir, 'y.npy'), y)
+    # Written last: its presence marks a complete folds directory
+    np.save(os.path.join(folds_dir, 'scaled.npy'), scaled)
+    return folds_dir
+
+
+_worker_folds = None
+_worker_candidates = None
+
+
+def _init_worker(folds_dir, seed):
+    # One estimator per worker process at a time; keep BLAS/OpenMP from oversubscribing the cores
+    global _worker_folds, _worker_candidates
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+    _worker_folds = {name: np.load(os.path.join(folds_dir, f'{name}.npy'), mmap_mode='r')
+                     for name in ('X', 'scaled', 'fold', 'y')}
+    _worker_candidates = candidates(seed)
+
+
+def evaluate_fold(name, fold):
+    """Fit config ``name`` on one fold's training rows; accuracy and timings on its test rows."""
+    from sklearn.base import clone
+    estimator = clone(_worker_candidates[name])
+    test = _worker_folds['fold'] == fold
+    y = np.asarray(_worker_folds['y'])
+    raw = pd.DataFrame(np.asarray(_worker_folds['X']), columns=CROP_FEATURES)
+
+    start = time.perf_counter()
+    if isinstance(estimator, HybridCropClassifier):
+        # Hybrids fit their own scaler on the raw features
+        model = estimator.fit(raw[~test], y[~test])
+    else:
+        estimator.fit(np.asarray(_worker_folds['scaled'][fold])[~test], y[~test])
+    fit_seconds = time.perf_counter() - start
+    if not isinstance(estimator, HybridCropClassifier):
+        # Same scaler as the precomputed fold, in front of the fitted estimator
+        model = servable(estimator, MinMaxScaler().fit(raw[~test]))
+
+    # Timed through the served model with DataFrame input, as the app calls it
+    raw_test = raw[test]
+    start = time.perf_counter()
+    predictions = model.predict(raw_test)
+    batch_seconds = time.perf_counter() - start
+
+    single = []
+    for i in range(min(SINGLE_ROW_REPEATS, len(raw_test))):
+        row = raw_test.iloc[[i]]
+        start = time.perf_counter()
+        inference.crop_probabilities(model, row)
+        single.append(time.perf_counter() - start)
+    return {
+        "accuracy": float(accuracy_score(y[test], predictions)),
+        "fit_seconds": fit_seconds,
+        "predict_us_per_row": batch_seconds / len(raw_test) * 1e6,
+        "single_row_ms": float(np.median(single)) * 1000,
+    }
+
+
+def _cache_path(cache_dir, key, fold):
+    return os.path.join(cache_dir, 'results', f'{key}-fold{fold}.json')
+
+
+def cross_validate(configs, folds_dir, cache_dir, n_folds, seed=DEFAULT_SEED, workers=None):
+    """Per-fold results for every config, evaluating only the (config, fold) pairs not cached yet.
+
+    Returns ({name: [fold results]}, number of folds evaluated in this run).
+    """
+    data_key = os.path.basename(folds_dir)
+    keys = {name: config_key(estimator, data_key) for name, estimator in configs.items()}
+    results = {name: [None] * n_folds for name in configs}
+    pending = []
+    for name, key in keys.items():
+        for fold in range(n_folds):
+            path = _cache_path(cache_dir, key, fold)
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[name][fold] = json.load(f)
+            else:
+                pending.append((name, fold))
+    if not pending:
+        return results, 0
+
+    os.makedirs(os.path.join(cache_dir, 'results'), exist_ok=True)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(folds_dir, seed)) as pool:
+        futures = {pool.submit(evaluate_fold, name, fold): (name, fold) for name, fold in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            name, fold = futures[future]
+            results[name][fold] = result = future.result()
+            # Cached as soon as it finishes, so an interrupted run keeps its progress
+            path = _cache_path(cache_dir, keys[name], fold)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(result, f)
+            os.replace(path + '.tmp', path)
+            print(f"[{done}/{len(pending)}] {name} fold {fold}: {result['accuracy']:.4f}", flush=True)
+    return results, len(pending)
+
+
+def summarize(results):
+    """One row per config (mean over folds), with its accuracy/latency frontier flag, best first."""
+    rows = []
+    for name, folds in results.items():
+        accuracy = [f['accuracy'] for f in folds]
+        rows.append({
+            "model": name,
+            "accuracy": float(np.mean(accuracy)),
+            "accuracy_std": float(np.std(accuracy)),
+            "fit_seconds": float(np.mean([f['fit_seconds'] for f in folds])),
+            "predict_us_per_row": float(np.mean([f['predict_us_per_row'] for f in folds])),
+            "single_row_ms": float(np.median([f['single_row_ms'] for f in folds])),
+        })
+    # On the frontier: more accurate than every config with lower single-row latency
+    best = -1.0
+    for row in sorted(rows, key=lambda r: (r['single_row_ms'], -r['accuracy'])):
+        row['frontier'] = row['accuracy'] > best
+        best = max(best, row['accuracy'])
+    return sorted(rows, key=lambda r: (-r['accuracy'], r['single_row_ms']))
+
+
+def choose(summary, max_latency_ms=None):
+    """Most accurate config within the latency budget; ties go to the faster one."""
+    eligible = [r for r in summary if max_latency_ms is None or r['single_row_ms'] <= max_latency_ms]
+    if not eligible:
+        raise ValueError(f"No config predicts a single row within {max_latency_ms} ms")
+    return max(eligible, key=lambda r: (r['accuracy'], -r['single_row_ms']))
+
+
+def print_table(summary, winner):
+    print(f"{'model':<30} {'accuracy':>15} {'fit s':>8} {'us/row':>9} {'1-row ms':>9}")
+    for row in summary:
+        marks = ('*' if row['frontier'] else ' ') + ('<' if row is winner else ' ')
+        print(f"{row['model']:<30} {row['accuracy']:.4f} ±{row['accuracy_std']:.4f} "
+              f"{row['fit_seconds']:>8.3f} {row['predict_us_per_row']:>9.1f} {row['single_row_ms']:>9.3f} {marks}")
+    print("* accuracy/latency frontier, < selected")
+
+
+def labels_path(model_path):
+    return os.path.splitext(model_path)[0] + '_labels.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate the crop model candidates and export the winner")
+    parser.add_argument('--data', default='Crop_recommendation.csv')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--only', nargs='+', metavar='MODEL', help="Evaluate only these configs")
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help="Pick the most accurate config whose single-row latency is within this budget")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--report', default=DEFAULT_REPORT)
+    parser.add_argument('--output', default=CROP_MODEL_PATH)
+    args = parser.parse_args()
+
+    configs = candidates(args.seed)
+    if args.only:
+        unknown = sorted(set(args.only) - set(configs))
+        if unknown:
+            parser.error(f"Unknown configs: {', '.join(unknown)}; available: {', '.join(configs)}")
+        configs = {name: configs[name] for name in args.only}
+
+    # Same split as the notebook; the folds partition its training part
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=1)
+    folds_dir = write_folds(X_train, y_train, args.cache_dir, args.folds, args.seed)
+
+    start = time.perf_counter()
+    results, evaluated = cross_validate(configs, folds_dir, args.cache_dir, args.folds, args.seed,
+                                        args.workers)
+    print(f"Evaluated {evaluated} folds ({len(configs) * args.folds - evaluated} cached) "
+          f"in {time.perf_counter() - start:.1f}s")
+    summary = summarize(results)
+    try:
+        winner = choose(summary, args.max_latency_ms)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    print_table(summary, winner)
+
+    model = servable(configs[winner['model']])
+    model.fit(X_train, y_train)
+    holdout = float(accuracy_score(y_test, model.predict(X_test)))
+    print(f"Selected {winner['model']}: holdout accuracy {holdout:.4f}")
+
+    joblib.dump(model, args.output)
+    classes = [int(c) for c in model.classes_]
+    with open(labels_path(args.output), 'w') as f:
+        json.dump({"classes": classes, "labels": [crop_labels[c] for c in classes]}, f, indent=2)
+    with open(args.report, 'w') as f:
+        json.dump({"data": args.data, "folds": args.folds, "seed": args.seed,
+                   "max_latency_ms": args.max_latency_ms, "selected": winner['model'],
+                   "holdout_accuracy": holdout, "results": summary}, f, indent=2)
+    print(f"Saved {args.output}, {labels_path(args.output)} and {args.report}")
+
+
+if __name__ == '__main__':
+    main()
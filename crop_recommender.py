@@ -0,0 +1,222 @@
+"""Memoized crop recommendation on the slider grid.
+
+The crop form only produces discrete values (integer N/P/K/humidity, pH in
+0.1 steps, temperature in 0.5 steps, rainfall in 50 mm steps), so each input
+maps to an integer grid index. Top-k predictions are memoized per index, and whole
+regions of the grid can be scored in one vectorized call into a dense lookup
+table (optionally saved to disk and loaded at startup):
+
+    python crop_recommender.py --range N=20:120 --range rainfall=0:3000 --output crop_table.npz
+
+Inputs that do not sit on the grid (e.g. API callers sending rainfall=202.9)
+bypass the memo and are predicted directly. Memoized results are identical to
+direct predictions; table results have the same ranking, with probabilities
+stored as float32 (within ~1e-7 of the model's float64 values).
+"""
+import argparse
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import inference
+import metrics
+import model_registry
+from model_registry import CROP_FEATURES
+
+# Slider step of each feature in the crop form
+GRID_STEPS = {'N': 1, 'P': 1, 'K': 1, 'temperature': 0.5, 'humidity': 1, 'ph': 0.1, 'rainfall': 50}
+# Slider defaults; features without a --range are fixed to these when precomputing
+GRID_DEFAULTS = {'N': 50, 'P': 50, 'K': 50, 'temperature': 25.0, 'humidity': 65, 'ph': 6.5, 'rainfall': 1000.0}
+
+DEFAULT_MAX_ENTRIES = 100_000
+MAX_GRID_ROWS = 20_000_000
+GRID_CHUNK_ROWS = 200_000
+CROP_TABLE_PATH = os.environ.get('CROP_TABLE_PATH', 'crop_table.npz')
+# Tables saved with another dtype (older float16 ones) are ignored and must be regenerated
+TABLE_PROB_DTYPE = np.float32
+
+
+def grid_index(features):
+    """Integer grid index of an input, or None if any value is off the slider grid or not finite."""
+    index = []
+    for name in CROP_FEATURES:
+        value = float(features[name])
+        if not math.isfinite(value):
+            return None
+        scaled = value / GRID_STEPS[name]
+        rounded = round(scaled)
+        if abs(scaled - rounded) > 1e-6:
+            return None
+        index.append(rounded)
+    return tuple(index)
+
+
+class LookupTable:
+    # Dense top-k table over a box of grid indices: labels[index - origin] holds
+    # the k best crop label indices, probs[index - origin] their probabilities
+    def __init__(self, origin, labels, probs, version):
+        self.origin = np.asarray(origin)
+        self.labels = labels
+        self.probs = probs
+        self.version = version
+
+    @property
+    def cells(self):
+        return int(np.prod(self.labels.shape[:-1]))
+
+    def get(self, index):
+        offset = np.asarray(index) - self.origin
+        if np.any(offset < 0) or np.any(offset >= self.labels.shape[:-1]):
+            return None
+        offset = tuple(offset)
+        return inference.crop_result(self.labels[offset], self.probs[offset])
+
+    def save(self, path):
+        np.savez_compressed(path, origin=self.origin, labels=self.labels, probs=self.probs,
+                            version=self.version)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['origin'], data['labels'], data['probs'], str(data['version']))
+
+
+class CropRecommender:
+    def __init__(self, model, version='', max_entries=DEFAULT_MAX_ENTRIES):
+        self.model = model
+        self.version = version
+        self.max_entries = max_entries
+        self.tables = []
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, index):
+        for table in self.tables:
+            result = table.get(index)
+            if result is not None:
+                return result
+        return self._memo.get(index)
+
+    def recommend(self, features, timer=None):
+        """Same result as inference.recommend_crop, served from the memo when possible."""
+        index = grid_index(features)
+        if index is not None:
+            with inference.timed_stage(timer, "memo lookup"):
+                with self._lock:
+                    result = self._lookup(index)
+                    if result is not None:
+                        self.hits += 1
+                        if index in self._memo:
+                            self._memo.move_to_end(index)
+                        return result
+                    self.misses += 1
+
+        result = inference.recommend_crop(self.model, features, timer)
+        if index is not None:
+            with self._lock:
+                self._memo[index] = result
+                if len(self._memo) > self.max_entries:
+                    self._memo.popitem(last=False)
+        return result
+
+    def precompute(self, ranges):
+        """Score a box of the grid in vectorized chunks and keep it as a lookup table.
+
+        ``ranges`` maps feature name -> (low, high) inclusive; other features
+        stay at their GRID_DEFAULTS value.
+        """
+        import pandas as pd
+
+        axes = []
+        for name in CROP_FEATURES:
+            low, high = ranges.get(name, (GRID_DEFAULTS[name], GRID_DEFAULTS[name]))
+            step = GRID_STEPS[name]
+            axes.append(np.arange(round(low / step), round(high / step) + 1))
+        shape = tuple(len(a) for a in axes)
+        rows = int(np.prod(shape))
+        if rows > MAX_GRID_ROWS:
+            raise ValueError(f"Grid has {rows} rows; narrow the ranges (limit {MAX_GRID_ROWS})")
+
+        steps = np.array([GRID_STEPS[name] for name in CROP_FEATURES])
+        origin = np.array([a[0] for a in axes])
+        k = min(inference.DEFAULT_TOP_K, len(self.model.classes_))
+        labels = np.empty((rows, k), dtype=np.int16)
+        probs = np.empty((rows, k), dtype=TABLE_PROB_DTYPE)
+        for start in range(0, rows, GRID_CHUNK_ROWS):
+            flat = np.arange(start, min(start + GRID_CHUNK_ROWS, rows))
+            offsets = np.stack(np.unravel_index(flat, shape), axis=1)
+            values = np.round((offsets + origin) * steps, 6)
+            chunk_probs, classes = inference.crop_probabilities(
+                self.model, pd.DataFrame(values, columns=CROP_FEATURES))
+            end = start + len(flat)
+            labels[start:end], probs[start:end] = inference.top_k_crops(chunk_probs, classes, k)
+
+        table = LookupTable(origin, labels.reshape(shape + (k,)), probs.reshape(shape + (k,)),
+                            self.version)
+        with self._lock:
+            self.tables.append(table)
+        return table
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memo_entries": len(self._memo),
+                "table_cells": sum(t.cells for t in self.tables),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_crop_recommender = None
+_crop_recommender_lock = threading.Lock()
+
+
+def get_crop_recommender(path=model_registry.CROP_MODEL_PATH):
+    """Process-wide recommender for the registry's crop model, rebuilt when the model changes.
+
+    A table saved at CROP_TABLE_PATH for the same model version is loaded on creation.
+    """
+    global _crop_recommender
+    entry = model_registry.get_crop_entry(path)
+    with _crop_recommender_lock:
+        if _crop_recommender is None or _crop_recommender.version != entry.version:
+            recommender = CropRecommender(entry.model, entry.version)
+            if os.path.exists(CROP_TABLE_PATH):
+                table = LookupTable.load(CROP_TABLE_PATH)
+                if table.version == entry.version and table.probs.dtype == TABLE_PROB_DTYPE:
+                    recommender.tables.append(table)
+            _crop_recommender = recommender
+            metrics.register_cache('crop_memo', recommender.stats)
+        return _crop_recommender
+
+
+def _parse_range(text):
+    name, _, bounds = text.partition('=')
+    if name not in GRID_STEPS or ':' not in bounds:
+        raise argparse.ArgumentTypeError(f"expected FEATURE=LOW:HIGH with FEATURE in {', '.join(CROP_FEATURES)}")
+    low, high = bounds.split(':')
+    return name, (float(low), float(high))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute a crop recommendation lookup table")
+    parser.add_argument('--range', dest='ranges', type=_parse_range, action='append', default=[],
+                        help="FEATURE=LOW:HIGH (inclusive, in slider units); repeatable")
+    parser.add_argument('--output', default=CROP_TABLE_PATH)
+    args = parser.parse_args()
+
+    entry = model_registry.get_crop_entry()
+    table = CropRecommender(entry.model, entry.version).precompute(dict(args.ranges))
+    table.save(args.output)
+    print(f"Saved {table.cells} cells {table.labels.shape[:-1]} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+# Class labels
+class_names = [
+    "Apple__Apple_scab", "Apple__Black_rot", "Apple__Cedar_apple_rust", "Apple__healthy",
+    "Blueberry__healthy", "Cherry_(including_sour)__Powdery_mildew", "Cherry_(including_sour)__healthy",
+    "Corn_(maize)__Cercospora_leaf_spot Gray_leaf_spot", "Corn_(maize)__Common_rust_",
+    "Corn_(maize)__Northern_Leaf_Blight", "Corn_(maize)__healthy", "Grape__Black_rot",
+    "Grape__Esca_(Black_Measles)", "Grape__Leaf_blight_(Isariopsis_Leaf_Spot)", "Grape__healthy",
+    "Orange__Haunglongbing_(Citrus_greening)", "Peach__Bacterial_spot", "Peach__healthy",
+    "Pepper,_bell__Bacterial_spot", "Pepper,_bell__healthy", "Potato__Early_blight",
+    "Potato__Late_blight", "Potato__healthy", "Raspberry__healthy", "Soybean__healthy",
+    "Squash__Powdery_mildew", "Strawberry__Leaf_scorch", "Strawberry__healthy",
+    "Tomato__Bacterial_spot", "Tomato__Early_blight", "Tomato__Late_blight",
+    "Tomato__Leaf_Mold", "Tomato__Septoria_leaf_spot",
+    "Tomato__Spider_mites Two-spotted_spider_mite", "Tomato__Target_Spot",
+    "Tomato__Tomato_Yellow_Leaf_Curl_Virus", "Tomato__Tomato_mosaic_virus", "Tomato__healthy"
+]
+
+# Format disease name for better readability
+def format_disease_name(disease_name):
+    parts = disease_name.split('__')
+    plant = parts[0].replace('_', ' ')
+    
+    if len(parts) > 1:
+        condition = parts[1].replace('_', ' ')
+        if condition.lower() == 'healthy':
+            return f"{plant} (Healthy)"
+        else:
+            return f"{plant}: {condition}"
+    return disease_name
@@ -0,0 +1,122 @@
+"""Export plant_disease.keras to lighter CPU inference formats.
+
+Produces:
+    plant_disease_fp32.tflite  - float32 TFLite
+    plant_disease_int8.tflite  - post-training INT8 quantized TFLite, calibrated
+                                 on a sample of the training images
+    plant_disease.onnx         - float32 ONNX (only with --onnx, needs tf2onnx)
+
+and reports top-1 agreement of each artifact against the Keras model:
+
+    python export_disease_model.py --calibration-dir Datasets/train --parity-dir Datasets/valid
+
+Serve an artifact by setting DISEASE_MODEL_BACKEND to tflite, tflite-int8 or onnx.
+"""
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+
+import inference
+from model_registry import DISEASE_BACKEND_PATHS
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def sample_images(directory, count, seed=0, exclude=()):
+    # Random sample of image paths from a directory tree (PlantVillage layout or flat)
+    exclude = {os.path.abspath(p) for p in exclude}
+    paths = []
+    for root, _, files in os.walk(directory):
+        found = (os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        paths.extend(p for p in found if os.path.abspath(p) not in exclude)
+    paths.sort()
+    random.Random(seed).shuffle(paths)
+    return paths[:count]
+
+
+def export_tflite_fp32(model, output_path):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_tflite_int8(model, calibration_paths, output_path):
+    import tensorflow as tf
+
+    def representative_dataset():
+        for path in calibration_paths:
+            yield [inference.load_image_array(path)[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    # Integer-only kernels; input and output stay float32 so callers need no changes
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path):
+    import tensorflow as tf
+    import tf2onnx
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=output_path)
+
+
+def top1_agreement(reference, candidate, arrays, batch_size=inference.DEFAULT_BATCH_SIZE):
+    expected = inference.predict_in_batches(reference, arrays, batch_size).argmax(axis=1)
+    actual = inference.predict_in_batches(candidate, arrays, batch_size).argmax(axis=1)
+    return float(np.mean(expected == actual))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the disease model to TFLite/ONNX")
+    parser.add_argument('--model', default=DISEASE_BACKEND_PATHS['keras'])
+    parser.add_argument('--calibration-dir', required=True,
+                        help="Training images used to calibrate INT8 quantization")
+    parser.add_argument('--num-calibration', type=int, default=200)
+    parser.add_argument('--parity-dir', help="Images for the parity check (defaults to --calibration-dir, "
+                                             "minus the calibration sample)")
+    parser.add_argument('--num-parity', type=int, default=500)
+    parser.add_argument('--onnx', action='store_true', help="Also export ONNX (requires tf2onnx)")
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+    from lite_models import ONNXModel, TFLiteModel
+
+    model = load_model(args.model)
+    calibration_paths = sample_images(args.calibration_dir, args.num_calibration)
+    if not calibration_paths:
+        parser.error(f"No images found under {args.calibration_dir}")
+    # Parity: images the quantizer has not seen, even when both samples come from one directory
+    parity_paths = sample_images(args.parity_dir or args.calibration_dir, args.num_parity, seed=1,
+                                 exclude=calibration_paths)
+    if not parity_paths:
+        parser.error("No images left for the parity check; pass --parity-dir")
+
+    artifacts = {}
+    export_tflite_fp32(model, DISEASE_BACKEND_PATHS['tflite'])
+    artifacts['tflite'] = TFLiteModel(DISEASE_BACKEND_PATHS['tflite'])
+    export_tflite_int8(model, calibration_paths, DISEASE_BACKEND_PATHS['tflite-int8'])
+    artifacts['tflite-int8'] = TFLiteModel(DISEASE_BACKEND_PATHS['tflite-int8'])
+    if args.onnx:
+        export_onnx(model, DISEASE_BACKEND_PATHS['onnx'])
+        artifacts['onnx'] = ONNXModel(DISEASE_BACKEND_PATHS['onnx'])
+
+    arrays = inference.decode_images(parity_paths)
+    report = {}
+    for backend, artifact in artifacts.items():
+        report[backend] = {
+            'path': DISEASE_BACKEND_PATHS[backend],
+            'bytes': os.path.getsize(DISEASE_BACKEND_PATHS[backend]),
+            'top1_agreement': top1_agreement(model, artifact, arrays),
+        }
+    print(json.dumps({'images': len(arrays), 'artifacts': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Servable version of the notebook's hybrid crop models.
+
+crop_analysis_and_prediction_.ipynb routes rows the primary model is unsure
+about to a fallback model, one row at a time. HybridCropClassifier bundles the
+MinMaxScaler, primary and fallback into a single scikit-learn estimator that
+scores confidence for the whole batch at once and calls the fallback only on
+the low-confidence subset, so it can be pickled as model.pkl and served by the
+app like any other classifier.
+"""
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.preprocessing import MinMaxScaler
+
+
+def xgboost_svm_hybrid(threshold=0.7):
+    """Hybrid Model 1 from the notebook: XGBoost with an RBF SVM fallback."""
+    import xgboost as xgb
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.svm import SVC
+    # SVC(probability=True) is deprecated; calibrating explicitly gives the same kind of
+    # cross-validated Platt probabilities
+    return HybridCropClassifier(
+        primary=xgb.XGBClassifier(eval_metric='mlogloss'),
+        fallback=CalibratedClassifierCV(SVC(kernel='rbf'), ensemble=False),
+        threshold=threshold,
+    )
+
+
+def gbm_rf_hybrid(threshold=0.7):
+    """Hybrid Model 2 from the notebook: gradient boosting with a random forest fallback."""
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    return HybridCropClassifier(
+        primary=GradientBoostingClassifier(n_estimators=100, learning_rate=0.1, max_depth=3,
+                                           random_state=42),
+        fallback=RandomForestClassifier(n_estimators=100, random_state=42),
+        threshold=threshold,
+    )
+
+
+class HybridCropClassifier(ClassifierMixin, BaseEstimator):
+    def __init__(self, primary, fallback, threshold=0.7, scaler=None):
+        self.primary = primary
+        self.fallback = fallback
+        self.threshold = threshold
+        self.scaler = scaler
+
+    def fit(self, X, y):
+        self.scaler_ = clone(self.scaler) if self.scaler is not None else MinMaxScaler()
+        X_scaled = self.scaler_.fit_transform(X)
+        self.primary_ = clone(self.primary).fit(X_scaled, y)
+        self.fallback_ = clone(self.fallback).fit(X_scaled, y)
+        self.classes_ = self.primary_.classes_
+        if not np.array_equal(self.classes_, self.fallback_.classes_):
+            raise ValueError("Primary and fallback models were fitted on different classes")
+        return self
+
+    def _scaled_with_proba(self, X):
+        X_scaled = self.scaler_.transform(X)
+        proba = np.asarray(self.primary_.predict_proba(X_scaled), dtype=np.float64)
+        low_confidence = proba.max(axis=1) < self.threshold
+        return X_scaled, proba, low_confidence
+
+    def predict_proba(self, X):
+        X_scaled, proba, low_confidence = self._scaled_with_proba(X)
+        if low_confidence.any():
+            proba[low_confidence] = self.fallback_.predict_proba(X_scaled[low_confidence])
+        return proba
+
+    def predict(self, X):
+        # The argmax of predict_proba, i.e. the crop the app ranks first; the notebook used the
+        # fallback's predict() labels, which a calibrated SVC does not always agree with
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def fallback_rate(self, X):
+        return float(self._scaled_with_proba(X)[2].mean())
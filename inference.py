@@ -0,0 +1,278 @@
+"""Prediction helpers shared by the Streamlit UI, the API server and offline tools."""
+import io
+import os
+from contextlib import nullcontext
+
+import numpy as np
+
+from crop_labels import crop_labels
+from disease_labels import class_names
+from label_index import get_label_index
+from model_registry import CROP_FEATURES
+import preprocessing
+from result_cache import cache_key
+import similarity_index
+from startup_report import timed_import
+
+IMAGE_SIZE = preprocessing.IMAGE_SIZE
+DEFAULT_BATCH_SIZE = 16
+# Best crop plus three alternatives
+DEFAULT_TOP_K = 4
+
+
+def timed_stage(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+# Resize and scale a decoded RGB image to a (224, 224, 3) float32 array in [0, 1],
+# written into ``out`` when given (e.g. a slot of a preallocated batch)
+def preprocess_image(img, timer=None, out=None):
+    if out is None:
+        out = preprocessing.new_batch(1)[0]
+    with timed_stage(timer, "resize"):
+        preprocessing.resize_into(img, out)
+    with timed_stage(timer, "normalize"):
+        return preprocessing.scale_inplace(out)
+
+
+# JPEGs are decoded at reduced resolution (still at least 224x224)
+def decode_image(source, timer=None):
+    with timed_stage(timer, "decode"):
+        return preprocessing.open_reduced(source)
+
+
+def load_image_array(source, out=None):
+    return preprocess_image(decode_image(source), out=out)
+
+
+# Decode many images concurrently into one preallocated (n, 224, 224, 3) batch
+def decode_images(sources, max_workers=None):
+    return preprocessing.load_batch(sources, max_workers=max_workers)
+
+
+# Run one model.predict per batch of at most batch_size images
+def predict_in_batches(model, arrays, batch_size=DEFAULT_BATCH_SIZE):
+    outputs = []
+    for start in range(0, len(arrays), batch_size):
+        batch = arrays[start:start + batch_size]
+        # Slices of a preallocated batch are views; only lists of images need stacking
+        if not isinstance(batch, np.ndarray):
+            batch = np.stack(batch)
+        outputs.append(model.predict(batch, verbose=0))
+    if not outputs:
+        return np.empty((0, len(class_names)), dtype=np.float32)
+    return np.concatenate(outputs)
+
+
+# Turn one probability vector into the result shown to users
+def describe_prediction(probs):
+    return get_label_index().describe(probs)
+
+
+def _predict_one(model, img, timer=None):
+    img_array = preprocess_image(img, timer)
+    with timed_stage(timer, "predict"):
+        return model.predict(img_array[np.newaxis], verbose=0)[0]
+
+
+def diagnose_image(model, img, timer=None):
+    """Diagnose one decoded RGB leaf image."""
+    probs = _predict_one(model, img, timer)
+    with timed_stage(timer, "remedy lookup"):
+        return describe_prediction(probs)
+
+
+def _diagnose_with_index(model, data, img, index, timer=None):
+    # ``model`` returns probabilities followed by the pooled embedding (similarity_index.EmbeddingModel)
+    digest = similarity_index.upload_digest(data)
+    with timed_stage(timer, "fingerprint"):
+        image_hash = similarity_index.fingerprint(img)
+        colours = similarity_index.colour_signature(img)
+        if similarity_index.SKIP_NEAR_DUPLICATES:
+            match = index.duplicate(digest, image_hash, colours)
+        else:
+            match = index.duplicate(digest)
+    if match is not None:
+        probs = index.case_probs(match)
+        with timed_stage(timer, "remedy lookup"):
+            result = describe_prediction(probs)
+        with timed_stage(timer, "similar cases"):
+            similar = index.similar_to_case(match)
+        return probs, dict(result, similar_cases=similar, near_duplicate=True)
+    probs, embedding = similarity_index.split_output(_predict_one(model, img, timer))
+    with timed_stage(timer, "remedy lookup"):
+        result = describe_prediction(probs)
+    with timed_stage(timer, "similar cases"):
+        similar = index.similar(embedding, probs)
+        index.add(embedding, digest, image_hash, colours, probs)
+    return probs, dict(result, similar_cases=similar, near_duplicate=False)
+
+
+def _similar_to_upload(index, data):
+    # Past cases around an upload the index has already seen, e.g. on a result cache hit
+    row = index.find_upload(similarity_index.upload_digest(data))
+    return index.similar_to_case(row) if row is not None else []
+
+
+def diagnose_upload(model, data, cache=None, model_version='', img=None, timer=None, index=None):
+    """Diagnose one uploaded image from its raw bytes, consulting the result cache first.
+
+    ``img`` may carry an already decoded copy of the upload to skip decoding again.
+    A worker pool (anything with ``predict_upload``) is handed the raw bytes instead.
+    With a similarity ``index``, ``model`` must also return embeddings (see
+    similarity_index.get_embedding_batcher): the result lists the closest past cases
+    under ``similar_cases``, and uploads the index can answer without the model are
+    flagged ``near_duplicate`` (and not written to the result cache).
+    """
+    if cache is not None:
+        key = cache_key(data, model_version)
+        with timed_stage(timer, "cache lookup"):
+            hit = cache.get(key)
+        if hit is not None:
+            with timed_stage(timer, "remedy lookup"):
+                result = dict(describe_prediction(hit[1]), cached=True)
+            if index is not None:
+                with timed_stage(timer, "similar cases"):
+                    result.update(similar_cases=_similar_to_upload(index, data), near_duplicate=False)
+            return result
+    if index is not None:
+        if img is None:
+            img = decode_image(io.BytesIO(data), timer)
+        probs, result = _diagnose_with_index(model, data, img, index, timer)
+        if cache is not None and not result["near_duplicate"]:
+            cache.put(key, result["class"], probs)
+        return dict(result, cached=False)
+    if hasattr(model, "predict_upload"):
+        probs = model.predict_upload(data, timer)
+    else:
+        if img is None:
+            img = decode_image(io.BytesIO(data), timer)
+        probs = _predict_one(model, img, timer)
+    with timed_stage(timer, "remedy lookup"):
+        result = describe_prediction(probs)
+    if cache is not None:
+        cache.put(key, result["class"], probs)
+    return dict(result, cached=False)
+
+
+def _read_bytes(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    data = source.read()
+    source.seek(0)
+    return data
+
+
+def diagnose_images(model, sources, names=None, batch_size=DEFAULT_BATCH_SIZE,
+                    max_workers=None, cache=None, model_version=''):
+    """Diagnose several leaf images; returns one result dict per image, in input order.
+
+    With a cache, only images whose bytes have not been seen are decoded and predicted.
+    """
+    names = names if names is not None else [getattr(s, "name", str(s)) for s in sources]
+    results = [None] * len(sources)
+    pending = list(range(len(sources)))
+    if cache is not None:
+        keys = [cache_key(_read_bytes(s), model_version) for s in sources]
+        pending = []
+        for i, key in enumerate(keys):
+            hit = cache.get(key)
+            if hit is None:
+                pending.append(i)
+            else:
+                results[i] = describe_prediction(hit[1])
+
+    if hasattr(model, "predict_uploads"):
+        # Worker pools decode in their own processes
+        probabilities = model.predict_uploads([_read_bytes(sources[i]) for i in pending], batch_size)
+    else:
+        arrays = decode_images([sources[i] for i in pending], max_workers=max_workers)
+        probabilities = predict_in_batches(model, arrays, batch_size=batch_size)
+    for i, probs in zip(pending, probabilities):
+        results[i] = describe_prediction(probs)
+        if cache is not None:
+            cache.put(keys[i], results[i]["class"], probs)
+    return [dict(image=name, **result) for name, result in zip(names, results)]
+
+
+# One-row model input in the column order the crop model was trained on
+def build_crop_input(features):
+    return build_crop_rows([features])
+
+
+# Model input for many farms: a list of feature dicts, or rows of values in CROP_FEATURES order
+def build_crop_rows(rows):
+    with timed_import('pandas'):
+        import pandas as pd
+    if len(rows) and isinstance(rows[0], dict):
+        missing = sorted({c for row in rows for c in CROP_FEATURES if c not in row})
+        if missing:
+            raise ValueError(f"Missing crop features: {', '.join(missing)}")
+        values = [[row[c] for c in CROP_FEATURES] for row in rows]
+    else:
+        values = rows
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), len(CROP_FEATURES))
+    if not np.isfinite(values).all():
+        raise ValueError("Crop features must be finite numbers")
+    return pd.DataFrame(values, columns=CROP_FEATURES)
+
+
+def has_probabilities(crop_model):
+    """Whether the crop model's scores are real class probabilities (it has predict_proba)."""
+    return hasattr(crop_model, "predict_proba")
+
+
+def crop_probabilities(crop_model, input_data):
+    """Class probabilities for each row, plus the crop label index of each column.
+
+    Estimators without predict_proba (e.g. an SVC trained without probability=True)
+    fall back to a softmax over their decision_function scores, which is not calibrated:
+    it ranks crops correctly but should not be shown as a probability (see has_probabilities).
+    """
+    classes = np.asarray(crop_model.classes_)
+    if hasattr(crop_model, "predict_proba"):
+        return np.asarray(crop_model.predict_proba(input_data)), classes
+    scores = np.asarray(crop_model.decision_function(input_data), dtype=np.float64)
+    scores -= scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    return scores / scores.sum(axis=1, keepdims=True), classes
+
+
+# Top-k crop label indices and probabilities per row, best first
+def top_k_crops(probs, classes, k=DEFAULT_TOP_K):
+    k = min(k, probs.shape[1])
+    top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    top_probs = np.take_along_axis(probs, top, axis=1)
+    order = np.argsort(-top_probs, axis=1)
+    return (classes[np.take_along_axis(top, order, axis=1)],
+            np.take_along_axis(top_probs, order, axis=1))
+
+
+def crop_result(indices, probs):
+    ranked = [{"crop_index": int(i), "crop": crop_labels[i], "probability": float(p)}
+              for i, p in zip(indices, probs)]
+    return dict(ranked[0], alternatives=ranked[1:])
+
+
+def recommend_crop(crop_model, features, timer=None, k=DEFAULT_TOP_K):
+    """Recommend crops for one set of N, P, K, temperature, humidity, ph, rainfall values.
+
+    Returns the best crop with its probability and the next k - 1 alternatives.
+    """
+    with timed_stage(timer, "build input"):
+        input_data = build_crop_input(features)
+    with timed_stage(timer, "predict"):
+        probs, classes = crop_probabilities(crop_model, input_data)
+    with timed_stage(timer, "label lookup"):
+        indices, top_probs = top_k_crops(probs, classes, k)
+        return crop_result(indices[0], top_probs[0])
+
+
+def recommend_crops(crop_model, rows, k=DEFAULT_TOP_K):
+    """Top-k recommendations for many farms with a single predict_proba call."""
+    probs, classes = crop_probabilities(crop_model, build_crop_rows(rows))
+    indices, top_probs = top_k_crops(probs, classes, k)
+    return [crop_result(i, p) for i, p in zip(indices, top_probs)]
@@ -0,0 +1,68 @@
+"""Compiled label index for the disease model.
+
+Built once per process from disease_labels.class_names and remedies.json:
+every class id maps to its display name, plant, healthy flag and remedy, so a
+prediction is described by plain tuple indexing. The index refuses to build if
+remedies.json and class_names disagree, and the model registry checks it
+against the model's output dimension when the model loads, so label drift is
+a startup error instead of a silent "No specific remedy" at request time.
+"""
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from disease_labels import class_names, format_disease_name
+
+REMEDIES_PATH = 'remedies.json'
+
+
+class LabelIndexError(ValueError):
+    pass
+
+
+class LabelIndex:
+    def __init__(self, names, remedies):
+        missing = [n for n in names if n not in remedies]
+        unknown = [k for k in remedies if k not in names]
+        if missing or unknown:
+            raise LabelIndexError(
+                f"remedies.json does not match the model classes; "
+                f"missing remedies: {missing or 'none'}, unknown keys: {unknown or 'none'}")
+
+        self.class_names = tuple(names)
+        self.display_names = tuple(format_disease_name(n) for n in names)
+        self.plants = tuple(n.split('__')[0].replace('_', ' ') for n in names)
+        self.healthy = tuple(n.lower().endswith('__healthy') for n in names)
+        self.remedies = tuple(remedies[n] for n in names)
+
+    def __len__(self):
+        return len(self.class_names)
+
+    def check_output_dim(self, num_outputs):
+        if num_outputs != len(self):
+            raise LabelIndexError(f"Disease model has {num_outputs} outputs but "
+                                  f"{len(self)} classes are defined in disease_labels.py")
+
+    def describe(self, probs):
+        class_id = int(np.argmax(probs))
+        return {
+            "class": self.class_names[class_id],
+            "condition": self.display_names[class_id],
+            "plant": self.plants[class_id],
+            "healthy": self.healthy[class_id],
+            "confidence": float(probs[class_id]),
+            "remedy": self.remedies[class_id],
+        }
+
+
+# Raises FileNotFoundError if remedies.json is missing
+def load_remedies(path=REMEDIES_PATH):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+# Built once per process
+@lru_cache(maxsize=None)
+def get_label_index(remedies_path=REMEDIES_PATH):
+    return LabelIndex(class_names, load_remedies(remedies_path))
@@ -0,0 +1,89 @@
+"""Lightweight runtimes for the exported disease model (see export_disease_model.py).
+
+Both wrappers expose ``input_shape`` and ``predict(batch, verbose=0)`` like the
+Keras model, so the registry, micro-batcher and inference helpers can serve
+them unchanged. Neither needs the full TensorFlow import when the standalone
+``tflite_runtime`` / ``onnxruntime`` packages are installed.
+"""
+import threading
+
+import numpy as np
+
+from startup_report import timed_import
+
+
+def import_tflite_interpreter():
+    """The TFLite Interpreter class, from tflite_runtime if installed, else from TensorFlow."""
+    with timed_import('tflite runtime'):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+def import_onnxruntime():
+    with timed_import('onnxruntime'):
+        import onnxruntime
+    return onnxruntime
+
+
+def _tflite_interpreter(path, num_threads):
+    return import_tflite_interpreter()(model_path=path, num_threads=num_threads)
+
+
+class TFLiteModel:
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self._interpreter = _tflite_interpreter(path, num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(self._input['shape'][1:])
+        # The interpreter holds mutable tensor state, so calls are serialized
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if self._input['shape'][0] != batch_size:
+            shape = [batch_size] + list(self._input['shape'][1:])
+            self._interpreter.resize_tensor_input(self._input['index'], shape)
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if self._output['dtype'] == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        with self._lock:
+            self._resize(len(batch))
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])
+            return self._dequantize(output.copy())
+
+
+class ONNXModel:
+    def __init__(self, path, num_threads=None):
+        ort = import_onnxruntime()
+        self.path = path
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+        self.input_shape = (None,) + tuple(self._session.get_inputs()[0].shape[1:])
+
+    def predict(self, batch, verbose=0):
+        return self._session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
@@ -0,0 +1,253 @@
+"""Prometheus-style metrics and structured per-request logs.
+
+A small thread-safe registry (no client library needed) keeps request and
+error counts, per-stage latency histograms and the predicted-class
+distribution; model load times and cache hit rates are read from the model
+registry and the registered caches at scrape time. ``render()`` produces the
+Prometheus text format, served by the API at ``/metrics`` and, for the
+Streamlit app, by ``start_http_server`` on METRICS_PORT (default 9464, 0 to
+disable). Every tracked request also emits one JSON log line.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9464))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; spans a memo hit (~50 µs) to a cold 12 MP diagnosis
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+# One JSON object per line on stderr, independent of the host app's logging setup
+request_log = logging.getLogger('agrirevolt.requests')
+if not request_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    request_log.addHandler(_handler)
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} '
+                                 f'{cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+REQUESTS = Counter('agrirevolt_requests_total', 'Requests handled, by tool and outcome.', ['tool', 'status'])
+ERRORS = Counter('agrirevolt_errors_total', 'Failed requests, by tool and exception type.', ['tool', 'error'])
+REQUEST_SECONDS = Histogram('agrirevolt_request_seconds', 'End-to-end request latency.', ['tool'])
+STAGE_SECONDS = Histogram('agrirevolt_stage_seconds', 'Latency of each pipeline stage.', ['tool', 'stage'])
+PREDICTIONS = Counter('agrirevolt_predictions_total', 'Predicted classes, by tool.', ['tool', 'label'])
+_metrics = [REQUESTS, ERRORS, REQUEST_SECONDS, STAGE_SECONDS, PREDICTIONS]
+
+# name -> zero-argument callable returning a stats() dict with hits/misses/hit_rate
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def register_cache(name, stats):
+    """Expose a cache's hit/miss counts under ``name``; re-registering replaces it."""
+    with _caches_lock:
+        _caches[name] = stats
+
+
+def _gauge(name, documentation, samples, metric_type='gauge'):
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} '
+                     f'{_format_value(value)}')
+    return lines
+
+
+def _runtime_lines():
+    import model_registry
+
+    entries = model_registry.loaded_entries()
+    lines = _gauge('agrirevolt_model_load_seconds', 'Time to load each model file.',
+                   [((('model', p), ('version', e.version)), e.load_seconds) for p, e in entries.items()])
+    lines += _gauge('agrirevolt_model_warmup_seconds', 'First (warm-up) inference after each load.',
+                    [((('model', p), ('version', e.version)), e.warmup_seconds) for p, e in entries.items()])
+
+    with _caches_lock:
+        caches = {name: stats() for name, stats in _caches.items()}
+    for field, metric_type in (('hits', 'counter'), ('misses', 'counter'), ('hit_rate', 'gauge')):
+        suffix = '_total' if metric_type == 'counter' else ''
+        lines += _gauge(f'agrirevolt_cache_{field}{suffix}', f'Cache {field.replace("_", " ")}.',
+                        [((('cache', name),), stats[field]) for name, stats in caches.items()], metric_type)
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    lines += _runtime_lines()
+    return '\n'.join(lines) + '\n'
+
+
+def _log(record):
+    request_log.info(json.dumps(record, default=str))
+
+
+@contextmanager
+def track_request(tool, timer=None, **fields):
+    """Count, time and log one request.
+
+    Yields the log record; the caller may add fields (e.g. ``prediction``) or set
+    ``status`` (``rejected`` for bad input). Stage latencies come from ``timer``.
+    An exception is counted as an error, tagged with the request id, logged with
+    the record and re-raised.
+    """
+    record = dict(event='request', tool=tool, request_id=uuid.uuid4().hex[:12], status='ok')
+    record.update(fields)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record.update(status='error', error=type(e).__name__, message=str(e))
+        ERRORS.inc(tool=tool, error=type(e).__name__)
+        e.request_id = record['request_id']
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS.inc(tool=tool, status=record['status'])
+        REQUEST_SECONDS.observe(elapsed, tool=tool)
+        stages = {}
+        if timer is not None:
+            for stage, seconds in timer.durations.items():
+                STAGE_SECONDS.observe(seconds, tool=tool, stage=stage)
+                stages[stage] = round(seconds * 1000, 3)
+        predictions = record.get('prediction')
+        for label in [predictions] if isinstance(predictions, str) else predictions or ():
+            PREDICTIONS.inc(tool=tool, label=label)
+        record.update(ts=datetime.now(timezone.utc).isoformat(), total_ms=round(elapsed * 1000, 3))
+        if stages:
+            record['stages_ms'] = stages
+        _log(record)
+
+
+def record_exception(tool, error):
+    """Count and log an error raised outside a tracked request; returns its reference id.
+
+    Errors that escaped ``track_request`` were already counted and keep their request id.
+    """
+    reference = getattr(error, 'request_id', None)
+    if reference is None:
+        reference = uuid.uuid4().hex[:12]
+        ERRORS.inc(tool=tool, error=type(error).__name__)
+        _log({'event': 'error', 'tool': tool, 'request_id': reference, 'error': type(error).__name__,
+              'message': str(error), 'ts': datetime.now(timezone.utc).isoformat()})
+    logger.error("%s failed (reference %s)", tool, reference, exc_info=error)
+    return reference
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_attempted = False
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=METRICS_PORT, host='127.0.0.1'):
+    """Serve /metrics from a daemon thread, once per process; returns the server or None.
+
+    A port already in use (e.g. a second app process) is logged and skipped.
+    """
+    global _server, _server_attempted
+    with _server_lock:
+        if not _server_attempted and port:
+            _server_attempted = True
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+        return _server
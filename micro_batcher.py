@@ -0,0 +1,119 @@
+"""Dynamic micro-batching for the disease model.
+
+Concurrent callers (Streamlit sessions, API requests) each submit single
+images; a background thread coalesces whatever arrives within a short wait
+window into one batch, runs a single forward pass and fans the rows of the
+result back to the callers' futures.
+
+A MicroBatcher exposes ``predict(batch, verbose=0)`` like a Keras model, so it
+can be passed anywhere inference.py expects a model.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+import model_registry
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 10
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._batches = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, array):
+        """Queue one input row; returns a Future resolving to its output row."""
+        future = Future()
+        self._queue.put((array, future))
+        return future
+
+    def predict(self, batch, verbose=0):
+        futures = [self.submit(row) for row in batch]
+        return np.stack([f.result() for f in futures])
+
+    def _collect(self):
+        # Block for the first item, then take whatever arrives until the
+        # batch is full or the wait window closes
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            # Skip callers that cancelled while queued
+            live = [(a, f) for a, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            arrays, futures = zip(*live)
+            try:
+                outputs = self.predict_fn(np.stack(arrays))
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            for f, out in zip(futures, outputs):
+                f.set_result(out)
+            with self._stats_lock:
+                self._requests += len(futures)
+                self._batches += 1
+                self._batch_sizes[len(futures)] += 1
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "requests": self._requests,
+                "batches": self._batches,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            }
+
+
+def _predict_with_registry_model(batch):
+    # Resolve the model per batch so a reloaded disease model is picked up
+    return model_registry.get_disease_model().predict(batch, verbose=0)
+
+
+_disease_batcher = None
+_disease_batcher_lock = threading.Lock()
+
+
+def get_disease_batcher(max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    """Process-wide batcher in front of the configured disease model.
+
+    The settings only apply to the call that creates it.
+    """
+    global _disease_batcher
+    with _disease_batcher_lock:
+        if _disease_batcher is None:
+            _disease_batcher = MicroBatcher(_predict_with_registry_model,
+                                            max_batch_size=max_batch_size,
+                                            max_wait_ms=max_wait_ms)
+        return _disease_batcher
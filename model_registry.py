@@ -0,0 +1,187 @@
+"""Process-wide registry for the AgriRevolt models.
+
+Streamlit re-executes Main_Ui.py on every interaction, but imported modules
+stay in ``sys.modules`` for the lifetime of the server process. Keeping the
+loaded models here means each artifact is deserialized (and warmed up) once
+and shared by every session, and only reloaded when the file on disk changes.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from startup_report import timed_import
+
+# Disease model artifacts, one per serving backend (see export_disease_model.py)
+DISEASE_BACKEND_PATHS = {
+    'keras': 'plant_disease.keras',
+    'tflite': 'plant_disease_fp32.tflite',
+    'tflite-int8': 'plant_disease_int8.tflite',
+    'onnx': 'plant_disease.onnx',
+}
+DISEASE_MODEL_BACKEND = os.environ.get('DISEASE_MODEL_BACKEND', 'keras')
+if DISEASE_MODEL_BACKEND not in DISEASE_BACKEND_PATHS:
+    raise ValueError(f"Unknown DISEASE_MODEL_BACKEND {DISEASE_MODEL_BACKEND!r}; "
+                     f"expected one of {', '.join(DISEASE_BACKEND_PATHS)}")
+
+# Model paths
+DISEASE_MODEL_PATH = DISEASE_BACKEND_PATHS[DISEASE_MODEL_BACKEND]
+CROP_MODEL_PATH = 'model.pkl'
+
+# Feature order the crop model was trained on
+CROP_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+_registry_lock = threading.Lock()
+_path_locks = {}
+_entries = {}
+
+
+class ModelEntry:
+    def __init__(self, path, model, mtime_ns, size, sha256, load_seconds, warmup_seconds):
+        self.path = path
+        self.model = model
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+
+    @property
+    def version(self):
+        # Short content hash, usable as a cache key / label for the loaded artifact
+        return self.sha256[:12]
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _path_lock(path):
+    with _registry_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def _intra_op_threads():
+    # Set per process by worker_pool.py; None leaves the runtime's default
+    value = os.environ.get('TF_NUM_INTRAOP_THREADS')
+    return int(value) if value else None
+
+
+def _load_disease_model(path):
+    # The runtime is picked from the artifact's extension
+    if path.endswith('.tflite'):
+        from lite_models import TFLiteModel
+        return TFLiteModel(path, num_threads=_intra_op_threads())
+    if path.endswith('.onnx'):
+        from lite_models import ONNXModel
+        return ONNXModel(path, num_threads=_intra_op_threads())
+    with timed_import('tensorflow'):
+        from tensorflow.keras.models import load_model
+    return load_model(path)
+
+
+def import_disease_runtime(path=DISEASE_MODEL_PATH):
+    """Import (and time) only the runtime _load_disease_model needs for ``path``."""
+    if path.endswith('.tflite'):
+        from lite_models import import_tflite_interpreter
+        import_tflite_interpreter()
+    elif path.endswith('.onnx'):
+        from lite_models import import_onnxruntime
+        import_onnxruntime()
+    else:
+        with timed_import('tensorflow'):
+            import tensorflow
+
+
+def _warmup_disease_model(model):
+    import numpy as np
+    from label_index import get_label_index
+    dummy = np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    output = model.predict(dummy, verbose=0)
+    # Fail at load time, not per request, if the labels do not fit the model
+    get_label_index().check_output_dim(output.shape[-1])
+
+
+def _load_crop_model(path):
+    with timed_import('joblib'):
+        import joblib
+    return joblib.load(path)
+
+
+def _warmup_crop_model(model):
+    with timed_import('pandas'):
+        import pandas as pd
+    dummy = pd.DataFrame([[0.0] * len(CROP_FEATURES)], columns=CROP_FEATURES)
+    model.predict(dummy)
+
+
+def get_entry(path, loader, warmup=None):
+    """Return the registry entry for ``path``, loading or reloading it if needed.
+
+    The cheap ``stat`` check runs on every call; the file is only re-hashed
+    when its mtime or size moved, and only reloaded when the hash differs.
+    """
+    st = os.stat(path)
+    entry = _entries.get(path)
+    if entry is not None and (entry.mtime_ns, entry.size) == (st.st_mtime_ns, st.st_size):
+        return entry
+
+    with _path_lock(path):
+        # Another session may have finished the reload while we waited
+        entry = _entries.get(path)
+        st = os.stat(path)
+        if entry is not None and (entry.mtime_ns, entry.size) == (st.st_mtime_ns, st.st_size):
+            return entry
+
+        sha256 = file_sha256(path)
+        if entry is not None and entry.sha256 == sha256:
+            # Touched but unchanged: just remember the new stat
+            entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+            return entry
+
+        start = time.perf_counter()
+        model = loader(path)
+        load_seconds = time.perf_counter() - start
+
+        warmup_seconds = 0.0
+        if warmup is not None:
+            start = time.perf_counter()
+            warmup(model)
+            warmup_seconds = time.perf_counter() - start
+
+        entry = ModelEntry(path, model, st.st_mtime_ns, st.st_size, sha256,
+                           load_seconds, warmup_seconds)
+        _entries[path] = entry
+        return entry
+
+
+def get_disease_entry(path=DISEASE_MODEL_PATH):
+    return get_entry(path, _load_disease_model, _warmup_disease_model)
+
+
+def get_crop_entry(path=CROP_MODEL_PATH):
+    return get_entry(path, _load_crop_model, _warmup_crop_model)
+
+
+def get_disease_model(path=DISEASE_MODEL_PATH):
+    return get_disease_entry(path).model
+
+
+def get_crop_model(path=CROP_MODEL_PATH):
+    return get_crop_entry(path).model
+
+
+def warm_all(disease=True):
+    # Load and warm every model present on disk, e.g. at server startup
+    if disease and os.path.exists(DISEASE_MODEL_PATH):
+        get_disease_entry()
+    if os.path.exists(CROP_MODEL_PATH):
+        get_crop_entry()
+
+
+def loaded_entries():
+    return dict(_entries)
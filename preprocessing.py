@@ -0,0 +1,60 @@
+"""Allocation-light image preprocessing for the disease model.
+
+- JPEGs are opened in draft mode, so libjpeg decodes straight to the smallest
+  DCT scale (1/2, 1/4, 1/8) that is still at least 224x224 instead of
+  decoding a 12 MP photo at full resolution.
+- Resized uint8 pixels are written directly into a preallocated float32 batch
+  buffer (one cast, no float64 or per-image intermediates).
+- The 1/255 scaling is a single in-place multiply over the whole batch.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from startup_report import timed_import
+
+IMAGE_SIZE = 224
+SCALE = np.float32(1.0 / 255.0)
+
+
+def pil_image():
+    with timed_import('PIL'):
+        from PIL import Image
+    return Image
+
+
+def open_reduced(source, size=IMAGE_SIZE):
+    """Decode an image as RGB, letting JPEG decoding skip resolution we will throw away."""
+    img = pil_image().open(source)
+    # No-op for formats without draft support (e.g. PNG)
+    img.draft('RGB', (size, size))
+    return img.convert('RGB')
+
+
+def new_batch(count, size=IMAGE_SIZE):
+    return np.empty((count, size, size, 3), dtype=np.float32)
+
+
+def resize_into(img, out, size=IMAGE_SIZE):
+    # uint8 pixels are cast to float32 while copying into the caller's buffer
+    np.copyto(out, np.asarray(img.resize((size, size))), casting='unsafe')
+    return out
+
+
+def scale_inplace(batch):
+    np.multiply(batch, SCALE, out=batch)
+    return batch
+
+
+def load_into(source, out, size=IMAGE_SIZE):
+    """Decode and resize one image into ``out`` (unscaled 0-255 values)."""
+    return resize_into(open_reduced(source, size), out, size)
+
+
+def load_batch(sources, max_workers=None, size=IMAGE_SIZE):
+    """Decode many images on a thread pool into one scaled (n, 224, 224, 3) float32 batch."""
+    batch = new_batch(len(sources), size)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Each worker writes its own slot; list() surfaces decode errors
+        list(pool.map(lambda i: load_into(sources[i], batch[i], size), range(len(sources))))
+    return scale_inplace(batch)
@@ -0,0 +1,123 @@
+"""Content-addressed cache of leaf diagnoses.
+
+Entries are keyed on the SHA-256 of the uploaded bytes plus the model version,
+so re-uploads and repeated Analyze clicks skip decode and inference entirely,
+and a reloaded model never serves stale results. The in-memory LRU is bounded
+by entry count and bytes; an optional SQLite file keeps results across restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_ENTRIES = 100_000
+
+
+def cache_key(data, model_version):
+    return f"{model_version}:{hashlib.sha256(data).hexdigest()}"
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 path=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                             "key TEXT PRIMARY KEY, class TEXT, probs BLOB, last_used REAL)")
+            self._db.commit()
+
+    def get(self, key):
+        """Return (predicted_class, probs) for key, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            value = self._load(key)
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, predicted_class, probs):
+        value = (predicted_class, np.asarray(probs, dtype=np.float32))
+        with self._lock:
+            self._remember(key, value)
+            self._store(key, value)
+
+    def _remember(self, key, value):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1].nbytes
+        self._entries[key] = value
+        self._bytes += value[1].nbytes
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT class, probs FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return row[0], np.frombuffer(row[1], dtype=np.float32).copy()
+
+    def _store(self, key, value):
+        if self._db is None:
+            return
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                         (key, value[0], value[1].tobytes(), time.time()))
+        # Trim the least recently used rows once the file outgrows its bound
+        self._db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results "
+                         "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_diagnosis_cache = None
+_diagnosis_cache_lock = threading.Lock()
+
+
+def get_diagnosis_cache():
+    """Process-wide diagnosis cache; set DIAGNOSIS_CACHE_PATH (e.g. diagnosis_cache.sqlite) to persist it to disk."""
+    global _diagnosis_cache
+    with _diagnosis_cache_lock:
+        if _diagnosis_cache is None:
+            _diagnosis_cache = ResultCache(path=os.environ.get('DIAGNOSIS_CACHE_PATH'))
+            metrics.register_cache('diagnosis', _diagnosis_cache.stats)
+        return _diagnosis_cache
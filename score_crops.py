@@ -0,0 +1,139 @@
+"""Bulk crop recommendation for large farm CSVs.
+
+Streams the input in chunks (same N, P, K, temperature, humidity, ph, rainfall
+columns as Crop_recommendation.csv), scores each chunk with model.pkl in one
+predict_proba call, and appends labels plus top-k probabilities to a CSV or
+Parquet file, so memory stays bounded by the chunk size and worker count:
+
+    python score_crops.py survey.csv scored.parquet --top-k 3 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import inference
+from crop_labels import crop_labels
+from model_registry import CROP_FEATURES, CROP_MODEL_PATH
+
+DEFAULT_CHUNK_ROWS = 100_000
+CROP_NAMES = np.array(crop_labels)
+
+_worker_model = None
+
+
+def _init_worker(model_path):
+    # Each worker process loads the model once
+    global _worker_model
+    _worker_model = joblib.load(model_path)
+
+
+def score_chunk(chunk, top_k, model=None):
+    model = model if model is not None else _worker_model
+    probs, classes = inference.crop_probabilities(model, chunk[CROP_FEATURES])
+    indices, top_probs = inference.top_k_crops(probs, classes, top_k)
+    # Chunks come straight from the reader, so annotate them in place; input columns
+    # (including a 'label' column) are kept as they are, the prediction is crop_1
+    scored = chunk
+    for rank in range(indices.shape[1]):
+        scored[f'crop_{rank + 1}'] = CROP_NAMES[indices[:, rank]]
+        scored[f'probability_{rank + 1}'] = top_probs[:, rank]
+    return scored
+
+
+class ChunkWriter:
+    # Appends scored chunks to a CSV or Parquet file, picked by extension
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # pandas infers dtypes per chunk; every row group must match the first
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def score_file(input_path, output_path, model_path=CROP_MODEL_PATH, chunk_rows=DEFAULT_CHUNK_ROWS,
+               top_k=3, workers=0):
+    """Score input_path into output_path; returns the number of rows scored."""
+    chunks = pd.read_csv(input_path, chunksize=chunk_rows, dtype={f: 'float64' for f in CROP_FEATURES})
+    writer = ChunkWriter(output_path)
+    rows = 0
+    try:
+        if workers <= 0:
+            model = joblib.load(model_path)
+            for chunk in chunks:
+                writer.write(score_chunk(chunk, top_k, model))
+                rows += len(chunk)
+            return rows
+
+        # Keep a bounded number of chunks in flight and write them back in input order
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, top_k))
+                if len(pending) >= 2 * workers:
+                    scored = pending.popleft().result()
+                    writer.write(scored)
+                    rows += len(scored)
+            while pending:
+                scored = pending.popleft().result()
+                writer.write(scored)
+                rows += len(scored)
+        return rows
+    finally:
+        writer.close()
+
+
+def _positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a large farm CSV with the crop model")
+    parser.add_argument('input', help="CSV with N, P, K, temperature, humidity, ph, rainfall columns")
+    parser.add_argument('output', help="Output .csv or .parquet file")
+    parser.add_argument('--model', default=CROP_MODEL_PATH)
+    parser.add_argument('--chunk-rows', type=_positive_int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--top-k', type=_positive_int, default=3)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Worker processes (0 scores in this process)")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error("Output must differ from input")
+
+    start = time.perf_counter()
+    rows = score_file(args.input, args.output, args.model, args.chunk_rows, args.top_k, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/sec)",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
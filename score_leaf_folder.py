@@ -0,0 +1,151 @@
+"""Offline disease scoring for folders of leaf photos.
+
+Walks a directory tree (PlantVillage class folders or a flat folder), decodes
+and resizes images on a thread pool while the previous batch is being
+predicted, and appends one CSV row per image with the prediction, confidence
+and remedy. Files already present in the results file are skipped, so an
+interrupted run picks up where it stopped:
+
+    python score_leaf_folder.py /data/field_photos results.csv --batch-size 64 --workers 8
+"""
+import argparse
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import inference
+import model_registry
+import preprocessing
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+RESULT_FIELDS = ['path', 'folder', 'class', 'condition', 'plant', 'healthy', 'confidence', 'remedy', 'error']
+
+
+def iter_image_paths(root):
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def completed_paths(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline='') as f:
+        return {row['path'] for row in csv.DictReader(f)}
+
+
+def _load(path):
+    # Decoded and resized uint8 pixels; scaling happens once per batch buffer
+    try:
+        img = preprocessing.open_reduced(path).resize((preprocessing.IMAGE_SIZE, preprocessing.IMAGE_SIZE))
+        return path, np.asarray(img), None
+    except Exception as e:
+        # Any decode failure (including PIL's DecompressionBombError) is recorded as an error row
+        return path, None, str(e) or type(e).__name__
+
+
+def _decoded(paths, pool, window):
+    # Keep at most `window` decodes submitted, yielding results in path order
+    in_flight = deque()
+    for path in paths:
+        in_flight.append(pool.submit(_load, path))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _produce_batches(paths, batch_size, workers, batches):
+    # Decode batch n + 1 while the consumer is predicting batch n; the bounded
+    # queue stops decoding from running too far ahead of inference
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            batch = []
+            for loaded in _decoded(paths, pool, 2 * batch_size):
+                batch.append(loaded)
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+    except BaseException as e:
+        # Handed to the consumer, so a failed producer is not mistaken for the end of input
+        batches.put(e)
+    finally:
+        batches.put(None)
+
+
+def score_folder(root, results_path, model, batch_size=inference.DEFAULT_BATCH_SIZE,
+                 workers=None, prefetch=4):
+    """Score every not-yet-scored image under root; returns the number scored in this run."""
+    done = completed_paths(results_path)
+    paths = [p for p in iter_image_paths(root) if p not in done]
+    if not paths:
+        return 0
+
+    batches = queue.Queue(maxsize=prefetch)
+    producer = threading.Thread(target=_produce_batches, args=(paths, batch_size, workers, batches),
+                                daemon=True)
+    producer.start()
+
+    write_header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    # One float32 input buffer reused for every batch
+    buffer = preprocessing.new_batch(batch_size)
+    scored = 0
+    with open(results_path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if write_header:
+            writer.writeheader()
+        while (batch := batches.get()) is not None:
+            if isinstance(batch, BaseException):
+                raise batch
+            loaded = [(path, array) for path, array, error in batch if error is None]
+            if loaded:
+                for slot, (_, pixels) in zip(buffer, loaded):
+                    np.copyto(slot, pixels, casting='unsafe')
+                inputs = preprocessing.scale_inplace(buffer[:len(loaded)])
+                probabilities = model.predict(inputs, verbose=0)
+                for (path, _), probs in zip(loaded, probabilities):
+                    result = inference.describe_prediction(probs)
+                    writer.writerow(dict(result, path=path, folder=os.path.basename(os.path.dirname(path)),
+                                         error=''))
+            # Unreadable files are recorded too, so a resumed run does not retry them
+            for path, _, error in batch:
+                if error is not None:
+                    writer.writerow({'path': path, 'folder': os.path.basename(os.path.dirname(path)),
+                                     'error': error})
+            f.flush()
+            scored += len(batch)
+    producer.join()
+    return scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a folder tree of leaf images")
+    parser.add_argument('root', help="Directory of images (PlantVillage layout or flat)")
+    parser.add_argument('results', help="CSV results file; appended to and resumed from")
+    parser.add_argument('--model', default=model_registry.DISEASE_MODEL_PATH)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Decode threads")
+    parser.add_argument('--prefetch', type=int, default=4, help="Decoded batches buffered ahead of inference")
+    args = parser.parse_args()
+
+    model = model_registry.get_disease_model(args.model)
+    start = time.perf_counter()
+    scored = score_folder(args.root, args.results, model, args.batch_size, args.workers, args.prefetch)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.1f} images/sec)",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
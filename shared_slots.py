@@ -0,0 +1,66 @@
+"""Shared-memory ring of image input slots and probability output slots.
+
+One ``multiprocessing.shared_memory`` block holds ``slots`` uint8 224x224x3
+input images followed by ``slots`` float32 probability rows. The front end
+decodes an upload straight into a free input slot, a worker process reads the
+pixels in place and writes the model output into the matching output slot, so
+only slot indices cross the process boundary. Slots are handed out in FIFO
+order from a free list, cycling through the block like a ring buffer; running
+out of free slots is the pool's backpressure signal.
+"""
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from disease_labels import class_names
+from preprocessing import IMAGE_SIZE
+
+
+class SlotRing:
+    def __init__(self, slots, output_dim=len(class_names), size=IMAGE_SIZE, name=None):
+        """Create a new block, or attach to an existing one by ``name`` (in a worker)."""
+        self.slots = slots
+        self.output_dim = output_dim
+        self.size = size
+        input_bytes = slots * size * size * 3
+        self.owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                               size=input_bytes + slots * output_dim * 4)
+        self.inputs = np.ndarray((slots, size, size, 3), dtype=np.uint8, buffer=self._shm.buf)
+        self.outputs = np.ndarray((slots, output_dim), dtype=np.float32, buffer=self._shm.buf,
+                                  offset=input_bytes)
+        # Only the owning process hands out slots
+        self._free = deque(range(slots))
+        self._cond = threading.Condition()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def free_slots(self):
+        with self._cond:
+            return len(self._free)
+
+    def acquire(self, count, timeout=None):
+        """Reserve ``count`` slots; returns their indices, or None if they did not free up in time."""
+        if count > self.slots:
+            raise ValueError(f"Requested {count} slots from a ring of {self.slots}")
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._free) >= count, timeout):
+                return None
+            return [self._free.popleft() for _ in range(count)]
+
+    def release(self, indices):
+        with self._cond:
+            self._free.extend(indices)
+            self._cond.notify_all()
+
+    def close(self):
+        # Views into the block must be dropped before it can be closed
+        self.inputs = self.outputs = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
@@ -0,0 +1,340 @@
+"""Similarity index of past leaf diagnoses.
+
+Every diagnosed upload is kept as a compact case: the model's pooled backbone
+embedding (unit-normalized, int8), a digest of the uploaded bytes, a 64-bit
+difference hash and a 4x4 mean-colour grid of the decoded image, the float16
+class probabilities and the predicted class (about 1.2 kB per case for the
+1024-d MobileNet embedding). A new upload is then answered in two steps:
+
+- The same bytes uploaded again are answered from the stored probabilities
+  without running the model. With SIMILARITY_NEAR_DUPLICATES=1, so is a
+  re-encoded or resized copy of a past photo: its difference hash must be
+  within NEAR_DUPLICATE_BITS and its colour grid within COLOUR_TOLERANCE,
+  since the grayscale hash alone cannot tell a green leaf from a rusty one.
+- Otherwise, after the prediction, the closest past cases are searched
+  IVF-style: the query's top ``nprobe`` predicted classes select the candidate
+  lists and only those cases are ranked by int8 cosine similarity. These fill
+  the "Similar Diseases" card.
+
+Embeddings come from the Keras model (probabilities and pooled features in one
+forward pass, see EmbeddingModel), so the index is only used with the
+``keras`` disease backend and without the worker pool. It is off unless
+SIMILARITY_INDEX_PATH names the file to keep it in (e.g. similar_cases.npz),
+and belongs to one model version.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+import model_registry
+import preprocessing
+from disease_labels import class_names
+from label_index import get_label_index
+from micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH', '')
+SIMILARITY_ENABLED = bool(SIMILARITY_INDEX_PATH) and model_registry.DISEASE_MODEL_BACKEND == 'keras'
+SKIP_NEAR_DUPLICATES = os.environ.get('SIMILARITY_NEAR_DUPLICATES') == '1'
+DEFAULT_MAX_CASES = 50_000
+DEFAULT_NPROBE = 3
+DEFAULT_NEIGHBOURS = 5
+# Differing dHash bits still treated as the same photo
+NEAR_DUPLICATE_BITS = 4
+# Largest mean absolute difference (0-255) between two photos' colour grids
+COLOUR_TOLERANCE = 12
+COLOUR_GRID = 4
+# Cases added between saves to disk
+SAVE_EVERY = 25
+
+_FIELDS = ('embeddings', 'digests', 'hashes', 'colours', 'probs', 'labels', 'added')
+# Set bits per byte value, for vectorized 64-bit popcounts
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_HASH_WEIGHTS = np.left_shift(np.uint64(1), np.arange(63, -1, -1, dtype=np.uint64))
+
+
+def fingerprint(img):
+    """64-bit difference hash of a decoded PIL image."""
+    gray = np.asarray(img.convert('L').resize((9, 8)), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return np.uint64(np.sum(_HASH_WEIGHTS[bits], dtype=np.uint64))
+
+
+def colour_signature(img):
+    """Mean RGB of each cell of a 4x4 grid over the image, as 48 uint8 values."""
+    Image = preprocessing.pil_image()
+    return np.asarray(img.convert('RGB').resize((COLOUR_GRID, COLOUR_GRID), Image.BOX),
+                      dtype=np.uint8).ravel()
+
+
+def upload_digest(data):
+    """First 64 bits of the SHA-256 of an upload's bytes."""
+    return np.frombuffer(hashlib.sha256(data).digest()[:8], dtype=np.uint64)[0]
+
+
+# Unit-normalize and quantize, so an int8 dot product / 127**2 is the cosine similarity
+def _unit_int8(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return np.round(vector / (norm or 1.0) * 127).astype(np.int8)
+
+
+class SimilarityIndex:
+    def __init__(self, version, dim, max_cases=DEFAULT_MAX_CASES, path=None):
+        """With a ``path``, every SAVE_EVERY new cases are written there from a background thread."""
+        self.version = version
+        self.dim = dim
+        self.max_cases = max_cases
+        self.path = path
+        self.count = 0
+        self.embeddings = np.empty((0, dim), dtype=np.int8)
+        self.digests = np.empty(0, dtype=np.uint64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.colours = np.empty((0, 3 * COLOUR_GRID ** 2), dtype=np.uint8)
+        self.probs = np.empty((0, len(class_names)), dtype=np.float16)
+        self.labels = np.empty(0, dtype=np.int16)
+        self.added = np.empty(0, dtype=np.float64)
+        self.near_duplicates = 0
+        self.lookups = 0
+        self._unsaved = 0
+        self._saving = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        capacity = min(self.max_cases, max(64, 2 * len(self.labels)))
+        for name in _FIELDS:
+            current = getattr(self, name)
+            grown = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:self.count] = current[:self.count]
+            setattr(self, name, grown)
+
+    def _next_row(self):
+        # Append until full, then overwrite the oldest case
+        if self.count < self.max_cases:
+            if self.count == len(self.labels):
+                self._grow()
+            self.count += 1
+            return self.count - 1
+        return int(np.argmin(self.added))
+
+    def add(self, embedding, digest, image_hash, colours, probs):
+        """Store one diagnosed image; returns its row."""
+        with self._lock:
+            row = self._next_row()
+            self.embeddings[row] = _unit_int8(embedding)
+            self.digests[row] = digest
+            self.hashes[row] = image_hash
+            self.colours[row] = colours
+            self.probs[row] = probs
+            self.labels[row] = int(np.argmax(probs))
+            self.added[row] = time.time()
+            self._unsaved += 1
+            save = self.path and self._unsaved >= SAVE_EVERY and not self._saving
+            self._saving = self._saving or bool(save)
+        if save:
+            threading.Thread(target=self._background_save, name='similarity-save', daemon=True).start()
+        return row
+
+    def find_upload(self, digest):
+        """Row of a past upload with the same bytes, or None."""
+        with self._lock:
+            rows = np.flatnonzero(self.digests[:self.count] == digest)
+            return int(rows[-1]) if len(rows) else None
+
+    def duplicate(self, digest, image_hash=None, colours=None, max_bits=NEAR_DUPLICATE_BITS,
+                  colour_tolerance=COLOUR_TOLERANCE):
+        """Row of a past upload whose stored diagnosis can stand in for this one, or None.
+
+        Identical bytes always match. With ``image_hash`` and ``colours``, so does the
+        closest photo within ``max_bits`` hash bits whose colour grid is also within
+        ``colour_tolerance``.
+        """
+        row = self.find_upload(digest)
+        with self._lock:
+            self.lookups += 1
+            if row is None and image_hash is not None and self.count:
+                xor = self.hashes[:self.count] ^ np.uint64(image_hash)
+                distance = _POPCOUNT[xor.view(np.uint8)].reshape(self.count, 8).sum(axis=1)
+                close = np.flatnonzero(distance <= max_bits)
+                if len(close):
+                    colour_distance = np.abs(self.colours[close].astype(np.int16) - colours).mean(axis=1)
+                    best = int(np.argmin(colour_distance))
+                    if colour_distance[best] <= colour_tolerance:
+                        row = int(close[best])
+            if row is not None:
+                self.near_duplicates += 1
+            return row
+
+    def case_probs(self, row):
+        with self._lock:
+            return self.probs[row].astype(np.float32)
+
+    def _search(self, query, probs, k, nprobe, exclude):
+        probe = np.argsort(-np.asarray(probs, dtype=np.float32))[:nprobe]
+        candidates = np.flatnonzero(np.isin(self.labels[:self.count], probe))
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        if not len(candidates):
+            return []
+        scores = (self.embeddings[candidates].astype(np.int32) @ query.astype(np.int32)) / 127.0 ** 2
+        top = np.argsort(-scores)[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _describe(self, matches):
+        labels = get_label_index()
+        return [{
+            "class": labels.class_names[self.labels[row]],
+            "condition": labels.display_names[self.labels[row]],
+            "similarity": round(score, 4),
+            "confidence": float(self.probs[row].max()),
+        } for row, score in matches]
+
+    def similar(self, embedding, probs, k=DEFAULT_NEIGHBOURS, nprobe=DEFAULT_NPROBE):
+        """The ``k`` closest past cases among the query's top ``nprobe`` classes, most similar first."""
+        with self._lock:
+            return self._describe(self._search(_unit_int8(embedding), probs, k, nprobe, None))
+
+    def similar_to_case(self, row, k=DEFAULT_NEIGHBOURS, nprobe=DEFAULT_NPROBE):
+        """Closest past cases to a stored case, excluding the case itself."""
+        with self._lock:
+            return self._describe(self._search(self.embeddings[row], self.probs[row], k, nprobe, row))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cases": self.count,
+                "hits": self.near_duplicates,
+                "misses": self.lookups - self.near_duplicates,
+                "hit_rate": self.near_duplicates / self.lookups if self.lookups else 0.0,
+            }
+
+    def save(self, path):
+        # Snapshot under the lock, write without holding it
+        with self._lock:
+            arrays = {name: getattr(self, name)[:self.count].copy() for name in _FIELDS}
+            self._unsaved = 0
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, version=np.array(self.version), **arrays)
+        os.replace(tmp_path, path)
+
+    def _background_save(self):
+        try:
+            self.save(self.path)
+        except OSError as e:
+            logger.warning("Could not save the similarity index to %s: %s", self.path, e)
+        finally:
+            self._saving = False
+
+    @classmethod
+    def load(cls, path, max_cases=DEFAULT_MAX_CASES):
+        with np.load(path) as data:
+            index = cls(str(data['version']), data['embeddings'].shape[1], max_cases, path)
+            # Keep the newest cases if the limit shrank
+            keep = np.sort(np.argsort(data['added'])[-max_cases:])
+            for name in _FIELDS:
+                setattr(index, name, data[name][keep])
+        index.count = len(index.labels)
+        return index
+
+
+class EmbeddingModel:
+    """Keras disease model whose output rows are the class probabilities followed
+    by the pooled backbone embedding, from a single forward pass.
+    """
+    def __init__(self, model):
+        import tensorflow as tf
+        pooling = [layer for layer in model.layers
+                   if isinstance(layer, tf.keras.layers.GlobalAveragePooling2D)]
+        if not pooling:
+            raise ValueError(f"{model.name} has no GlobalAveragePooling2D layer to take embeddings from")
+        self._model = tf.keras.Model(model.inputs, [model.outputs[0], pooling[-1].output])
+        self.embedding_dim = pooling[-1].output.shape[-1]
+
+    def predict(self, batch, verbose=0):
+        probs, pooled = self._model.predict(batch, verbose=verbose)
+        return np.concatenate([probs, pooled], axis=1)
+
+
+def split_output(row):
+    """(probabilities, embedding) from one EmbeddingModel output row."""
+    return row[:len(class_names)], row[len(class_names):]
+
+
+_embedding_models = {}
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model(entry=None):
+    """EmbeddingModel for the registry's current disease model, rebuilt when it is reloaded."""
+    entry = entry or model_registry.get_disease_entry()
+    with _embedding_lock:
+        if entry.version not in _embedding_models:
+            _embedding_models.clear()
+            _embedding_models[entry.version] = EmbeddingModel(entry.model)
+        return _embedding_models[entry.version]
+
+
+def _predict_with_embeddings(batch):
+    return get_embedding_model().predict(batch, verbose=0)
+
+
+_embedding_batcher = None
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_batcher():
+    """Process-wide micro-batcher returning probabilities followed by embeddings per row."""
+    global _embedding_batcher
+    with _index_lock:
+        if _embedding_batcher is None:
+            _embedding_batcher = MicroBatcher(_predict_with_embeddings)
+        return _embedding_batcher
+
+
+def _save():
+    if _index is not None and _index._unsaved:
+        _index.save(_index.path)
+
+
+def _stats():
+    return _index.stats()
+
+
+def get_similarity_index(model_version, path=SIMILARITY_INDEX_PATH):
+    """Process-wide index for ``model_version``, or None when disabled.
+
+    The saved index is reused if it belongs to the same model version; otherwise
+    (first run, or a new model) an empty index is started.
+    """
+    global _index
+    if not SIMILARITY_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None or _index.version != model_version:
+            _save()
+            loaded = None
+            if os.path.exists(path):
+                try:
+                    loaded = SimilarityIndex.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning("Ignoring unreadable similarity index %s: %s", path, e)
+            if loaded is not None and loaded.version == model_version:
+                _index = loaded
+            else:
+                _index = SimilarityIndex(model_version, get_embedding_model().embedding_dim, path=path)
+            metrics.register_cache('near_duplicate', _stats)
+        return _index
+
+
+atexit.register(_save)
@@ -0,0 +1,86 @@
+"""Cold-start accounting: heavy import times, model load times, first inference.
+
+Heavy imports go through ``timed_import`` so the app can show what startup
+actually cost; model load and warm-up (first inference) times come from the
+model registry. Run standalone for a fresh-process measurement:
+
+    python startup_report.py --tool crop
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+_import_seconds = {}
+
+
+@contextmanager
+def timed_import(name):
+    # Only the first import of a module is expensive, so keep the first timing
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _import_seconds.setdefault(name, time.perf_counter() - start)
+
+
+def import_module(name):
+    with timed_import(name):
+        return importlib.import_module(name)
+
+
+def report():
+    import model_registry
+    return {
+        "imports_ms": {name: round(s * 1000, 1) for name, s in _import_seconds.items()},
+        "models": {
+            path: {
+                "version": entry.version,
+                "load_ms": round(entry.load_seconds * 1000, 1),
+                "first_inference_ms": round(entry.warmup_seconds * 1000, 1),
+            }
+            for path, entry in model_registry.loaded_entries().items()
+        },
+    }
+
+
+# Modules each tool needs, in the order the app pulls them in; the disease
+# model's runtime depends on DISEASE_MODEL_BACKEND and is added by main()
+TOOL_IMPORTS = {
+    "crop": ["numpy", "pandas", "joblib", "sklearn"],
+    "disease": ["numpy", "PIL.Image"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start cost in a fresh process")
+    parser.add_argument("--tool", choices=["crop", "disease", "all"], default="all")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tools = ["crop", "disease"] if args.tool == "all" else [args.tool]
+    import model_registry
+    for tool in tools:
+        for name in TOOL_IMPORTS[tool]:
+            import_module(name)
+        if tool == "disease":
+            # TensorFlow for the Keras model, only tflite_runtime / onnxruntime for the lite ones
+            model_registry.import_disease_runtime()
+
+    if "disease" in tools and os.path.exists(model_registry.DISEASE_MODEL_PATH):
+        model_registry.get_disease_entry()
+    if "crop" in tools and os.path.exists(model_registry.CROP_MODEL_PATH):
+        model_registry.get_crop_entry()
+
+    result = report()
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    # Run the imported module's main: timings recorded through model_registry / lite_models
+    # go to that module's table, not to this __main__ copy's
+    import startup_report
+    startup_report.main()
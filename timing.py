@@ -0,0 +1,44 @@
+"""Per-stage wall-clock timing for the inference pipelines."""
+import time
+from contextlib import contextmanager
+
+# Stages of each pipeline, in execution order (used to drive progress bars)
+DISEASE_STAGES = ['decode', 'resize', 'normalize', 'predict', 'remedy lookup']
+CROP_STAGES = ['build input', 'predict', 'label lookup']
+
+
+class StageTimer:
+    def __init__(self, name, stages=(), on_stage=None):
+        self.name = name
+        self.stages = list(stages)
+        self.on_stage = on_stage
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, stage_name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage_name, time.perf_counter() - start)
+
+    def add(self, stage_name, seconds):
+        # Also used for stages timed elsewhere, e.g. in an inference worker process
+        self.durations[stage_name] = self.durations.get(stage_name, 0.0) + seconds
+        if self.on_stage is not None:
+            self.on_stage(stage_name, self.progress)
+
+    @property
+    def progress(self):
+        # Fraction of the known stages that have completed at least once
+        if not self.stages:
+            return 1.0
+        done = sum(1 for s in self.stages if s in self.durations)
+        return done / len(self.stages)
+
+    @property
+    def total(self):
+        return sum(self.durations.values())
+
+    def as_rows(self):
+        return [{'stage': s, 'ms': round(d * 1000, 2)} for s, d in self.durations.items()]
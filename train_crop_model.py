@@ -0,0 +1,65 @@
+"""Train the hybrid crop recommender and export it as model.pkl.
+
+    python train_crop_model.py --data Crop_recommendation.csv --hybrid xgb-svm
+
+Uses the same target encoding and train/test split as
+crop_analysis_and_prediction_.ipynb, so class indices line up with crop_labels.py.
+"""
+import argparse
+import time
+
+import joblib
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+import hybrid_ensemble
+from crop_labels import crop_labels
+from model_registry import CROP_FEATURES, CROP_MODEL_PATH
+
+HYBRIDS = {
+    'xgb-svm': hybrid_ensemble.xgboost_svm_hybrid,
+    'gbm-rf': hybrid_ensemble.gbm_rf_hybrid,
+}
+
+
+def load_dataset(path):
+    # Category codes follow sorted label order, which is what crop_labels lists
+    df = pd.read_csv(path)
+    labels = df.label.astype('category')
+    if list(labels.cat.categories) != crop_labels:
+        raise ValueError("Dataset labels do not match crop_labels.py")
+    return df[CROP_FEATURES], labels.cat.codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and export the hybrid crop model")
+    parser.add_argument('--data', default='Crop_recommendation.csv')
+    parser.add_argument('--hybrid', choices=sorted(HYBRIDS), default='xgb-svm')
+    parser.add_argument('--threshold', type=float, default=0.7,
+                        help="Primary-model confidence below which the fallback decides")
+    parser.add_argument('--output', default=CROP_MODEL_PATH)
+    args = parser.parse_args()
+
+    X, y = load_dataset(args.data)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=1)
+
+    model = HYBRIDS[args.hybrid](args.threshold)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = model.predict(X_test)
+    predict_seconds = time.perf_counter() - start
+
+    print(f"Hybrid {args.hybrid} accuracy: {accuracy_score(y_test, predictions):.4f}")
+    print(f"Fallback rate: {model.fallback_rate(X_test):.2%}")
+    print(f"Fit: {fit_seconds:.2f}s, predict: {predict_seconds / len(X_test) * 1e6:.1f} us/row")
+
+    joblib.dump(model, args.output)
+    print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
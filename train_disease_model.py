@@ -0,0 +1,303 @@
+"""Retrain the disease model head from cached MobileNet features.
+
+The notebook trains GlobalAveragePooling -> Dropout -> Dense on top of a frozen
+MobileNet, but re-runs the whole backbone over every image on every epoch.
+The frozen backbone's pooled output for an image never changes, so here it is
+computed once per image (plus optional augmented variants) into a memory-mapped
+feature store, and the head trains on those 1024-d vectors in seconds. The
+store is incremental: images already embedded (same path, size and mtime) are
+reused, so adding new field photos only embeds the new ones.
+
+Only optional fine-tuning (--fine-tune-epochs, unfreezing the top of the
+backbone) goes back to images, through a parallel, prefetching tf.data pipeline.
+
+    python train_disease_model.py --train-dir Datasets/train --valid-dir Datasets/valid --augment-variants 2
+
+Images use the serving preprocessing (preprocessing.py), and class folders may
+use the PlantVillage ``Plant___Condition`` names; labels follow disease_labels.py.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+import preprocessing
+from disease_labels import class_names
+from model_registry import DISEASE_BACKEND_PATHS
+from score_leaf_folder import iter_image_paths
+from startup_report import timed_import
+
+FEATURE_DIM = 1024
+BACKBONE = 'MobileNet/imagenet'
+DEFAULT_CACHE_DIR = 'feature_cache'
+
+
+def _tf():
+    with timed_import('tensorflow'):
+        import tensorflow as tf
+    return tf
+
+
+def labelled_images(image_dir):
+    """Image paths under class folders, with their class_names index."""
+    class_ids = {name: i for i, name in enumerate(class_names)}
+    paths, labels = [], []
+    for path in iter_image_paths(image_dir):
+        folder = os.path.basename(os.path.dirname(path)).replace('___', '__')
+        if folder not in class_ids:
+            raise ValueError(f"Folder {folder!r} is not a class in disease_labels.py")
+        paths.append(path)
+        labels.append(class_ids[folder])
+    return paths, np.array(labels, dtype=np.int16)
+
+
+def _load_scaled(path):
+    # Same decode/resize/scale as serving, for tf.numpy_function
+    out = preprocessing.new_batch(1)[0]
+    preprocessing.load_into(path.decode() if isinstance(path, bytes) else path, out)
+    return preprocessing.scale_inplace(out)
+
+
+def augmenter(seed=None):
+    # Shift and zoom as in the notebook's ImageDataGenerator (shear has no core Keras layer)
+    tf = _tf()
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest', seed=seed),
+        tf.keras.layers.RandomZoom(0.2, fill_mode='nearest', seed=seed),
+    ], name='augment')
+
+
+def image_dataset(paths, labels, batch_size, augment=None, shuffle=False, seed=0):
+    """Parallel decode, optional augmentation and prefetch with tf.data."""
+    tf = _tf()
+    size = preprocessing.IMAGE_SIZE
+    ds = tf.data.Dataset.from_tensor_slices((list(paths), np.asarray(labels, dtype=np.int32)))
+    if shuffle:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(lambda p, y: (tf.ensure_shape(tf.numpy_function(_load_scaled, [p], tf.float32), (size, size, 3)), y),
+                num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    ds = ds.batch(batch_size)
+    if augment is not None:
+        ds = ds.map(lambda x, y: (augment(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def mobilenet_backbone():
+    tf = _tf()
+    size = preprocessing.IMAGE_SIZE
+    backbone = tf.keras.applications.MobileNet(weights='imagenet', include_top=False, input_shape=(size, size, 3))
+    backbone.trainable = False
+    return backbone
+
+
+class FeatureStore:
+    """Pooled backbone features of one image folder, one row per (image, variant).
+
+    Row ``i * (variants + 1) + v`` holds image ``i``; variant 0 is the unaugmented image.
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.variants = self.manifest['variants']
+        self.paths = [entry[0] for entry in self.manifest['images']]
+        self.features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(directory, 'labels.npy'))
+
+    def rows(self, image_indices, variants=True):
+        """Feature-row indices of the given images (all variants, or originals only)."""
+        per_image = self.variants + 1
+        image_indices = np.asarray(image_indices)
+        if not variants:
+            return image_indices * per_image
+        return (image_indices[:, None] * per_image + np.arange(per_image)).ravel()
+
+
+def _image_keys(paths):
+    keys = []
+    for path in paths:
+        st = os.stat(path)
+        keys.append([path, st.st_size, st.st_mtime_ns])
+    return keys
+
+
+def build_feature_store(directory, image_dir, variants=0, batch_size=64, seed=0, backbone=None):
+    """Embed new or changed images of ``image_dir`` into the store at ``directory``; returns the store."""
+    paths, labels = labelled_images(image_dir)
+    keys = _image_keys(paths)
+    per_image = variants + 1
+
+    previous, old = {}, None
+    if os.path.exists(os.path.join(directory, 'manifest.json')):
+        old = FeatureStore(directory)
+        if old.manifest['backbone'] == BACKBONE and old.variants == variants:
+            previous = {tuple(key): i for i, key in enumerate(old.manifest['images'])}
+    os.makedirs(directory, exist_ok=True)
+
+    # Written to a temporary file and renamed, so an interrupted run leaves the old store intact
+    tmp_path = os.path.join(directory, 'features.tmp.npy')
+    features = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16,
+                                         shape=(len(paths) * per_image, FEATURE_DIM))
+    missing = []
+    for i, key in enumerate(keys):
+        j = previous.get(tuple(key))
+        if j is None:
+            missing.append(i)
+        else:
+            features[i * per_image:(i + 1) * per_image] = old.features[j * per_image:(j + 1) * per_image]
+    # Release the old mapping before its file is replaced
+    old = None
+
+    if missing:
+        tf = _tf()
+        backbone = backbone or mobilenet_backbone()
+        extractor = tf.keras.Sequential([backbone, tf.keras.layers.GlobalAveragePooling2D()])
+        for variant in range(per_image):
+            augment = augmenter(seed + variant) if variant else None
+            ds = image_dataset([paths[i] for i in missing], labels[missing], batch_size, augment=augment)
+            start = 0
+            for batch, _ in ds:
+                rows = np.asarray(missing[start:start + len(batch)]) * per_image + variant
+                features[rows] = extractor(batch, training=False).numpy()
+                start += len(batch)
+    features.flush()
+    del features
+
+    os.replace(tmp_path, os.path.join(directory, 'features.npy'))
+    np.save(os.path.join(directory, 'labels.npy'), np.repeat(labels, per_image))
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump({'backbone': BACKBONE, 'variants': variants, 'images': keys}, f)
+    print(f"{image_dir}: {len(paths)} images, {len(missing)} embedded, {len(paths) - len(missing)} reused")
+    return FeatureStore(directory)
+
+
+def _feature_dataset(store, rows, batch_size, shuffle=False, seed=0):
+    # Only the row indices go into tf.data; each batch is gathered from the memmap when
+    # consumed, so the store is never copied into RAM as a whole
+    tf = _tf()
+
+    def gather(batch_rows):
+        batch_rows = np.sort(batch_rows)  # ascending reads within the batch
+        return store.features[batch_rows].astype(np.float32), store.labels[batch_rows].astype(np.int32)
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(rows, dtype=np.int64))
+    if shuffle:
+        ds = ds.shuffle(len(rows), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(lambda r: tf.numpy_function(gather, [r], (tf.float32, tf.int32)),
+                                  num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.map(lambda x, y: (tf.ensure_shape(x, (None, FEATURE_DIM)), tf.ensure_shape(y, (None,))))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def train_head(train, valid, epochs=20, batch_size=256, dropout=0.2, seed=0):
+    """Fit Dropout -> Dense on (FeatureStore, rows) pairs; returns the head and its Keras history."""
+    tf = _tf()
+    tf.keras.utils.set_random_seed(seed)
+    head = tf.keras.Sequential([
+        tf.keras.Input(shape=(FEATURE_DIM,)),
+        tf.keras.layers.Dropout(dropout),
+        tf.keras.layers.Dense(len(class_names), activation='softmax'),
+    ], name='head')
+    # The notebook paired a softmax output with from_logits=True; probabilities are the output here
+    head.compile(optimizer=tf.keras.optimizers.Adam(1e-3),
+                 loss=tf.keras.losses.SparseCategoricalCrossentropy(), metrics=['accuracy'])
+    history = head.fit(_feature_dataset(*train, batch_size, shuffle=True, seed=seed),
+                       validation_data=_feature_dataset(*valid, batch_size), epochs=epochs, verbose=2)
+    return head, history
+
+
+def assemble_model(backbone, head, dropout=0.2):
+    """The served architecture (backbone -> GAP -> Dropout -> Dense) with the trained head weights."""
+    tf = _tf()
+    size = preprocessing.IMAGE_SIZE
+    inputs = tf.keras.Input(shape=(size, size, 3))
+    x = backbone(inputs, training=False)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(dropout)(x)
+    dense = tf.keras.layers.Dense(len(class_names), activation='softmax')
+    outputs = dense(x)
+    dense.set_weights(head.layers[-1].get_weights())
+    return tf.keras.Model(inputs=inputs, outputs=outputs, name='LeafDisease_MobileNet')
+
+
+def fine_tune(model, backbone, train_images, valid_images, epochs, unfreeze=20, batch_size=32,
+              learning_rate=1e-5, seed=0):
+    """Unfreeze the top ``unfreeze`` backbone layers and train end to end from images.
+
+    Batch-norm layers stay in inference mode (the backbone is called with training=False).
+    """
+    tf = _tf()
+    backbone.trainable = True
+    for layer in backbone.layers[:-unfreeze]:
+        layer.trainable = False
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate),
+                  loss=tf.keras.losses.SparseCategoricalCrossentropy(), metrics=['accuracy'])
+    train = image_dataset(*train_images, batch_size, augment=augmenter(seed), shuffle=True, seed=seed)
+    valid = image_dataset(*valid_images, batch_size)
+    return model.fit(train, validation_data=valid, epochs=epochs, verbose=2)
+
+
+def _holdout(count, fraction, seed):
+    indices = list(range(count))
+    random.Random(seed).shuffle(indices)
+    split = int(count * fraction)
+    return np.sort(indices[split:]), np.sort(indices[:split])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the disease model head from cached backbone features")
+    parser.add_argument('--train-dir', required=True, help="Class folders of training images")
+    parser.add_argument('--valid-dir', help="Class folders of validation images (default: hold out 10%%)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Feature store location")
+    parser.add_argument('--augment-variants', type=int, default=0,
+                        help="Augmented copies of each training image to embed alongside the original")
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=256, help="Head training batch size")
+    parser.add_argument('--embed-batch-size', type=int, default=64)
+    parser.add_argument('--fine-tune-epochs', type=int, default=0)
+    parser.add_argument('--unfreeze', type=int, default=20, help="Backbone layers unfrozen for fine-tuning")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DISEASE_BACKEND_PATHS['keras'])
+    args = parser.parse_args()
+
+    backbone = mobilenet_backbone()
+    start = time.perf_counter()
+    train_store = build_feature_store(os.path.join(args.cache_dir, 'train'), args.train_dir,
+                                      args.augment_variants, args.embed_batch_size, args.seed, backbone)
+    if args.valid_dir:
+        valid_store = build_feature_store(os.path.join(args.cache_dir, 'valid'), args.valid_dir,
+                                          0, args.embed_batch_size, args.seed, backbone)
+        train_idx = np.arange(len(train_store.paths))
+        valid_idx = np.arange(len(valid_store.paths))
+    else:
+        valid_store = train_store
+        train_idx, valid_idx = _holdout(len(train_store.paths), 0.1, args.seed)
+    print(f"Feature store ready in {time.perf_counter() - start:.1f}s")
+
+    # Augmented variants are for training only; validation uses the originals
+    train_rows = train_store.rows(train_idx)
+    valid_rows = valid_store.rows(valid_idx, variants=False)
+    start = time.perf_counter()
+    head, history = train_head((train_store, train_rows), (valid_store, valid_rows),
+                               args.epochs, args.batch_size, seed=args.seed)
+    print(f"Head trained in {time.perf_counter() - start:.1f}s, "
+          f"validation accuracy {history.history['val_accuracy'][-1]:.4f}")
+
+    model = assemble_model(backbone, head)
+    if args.fine_tune_epochs:
+        def images(store, indices):
+            originals = store.rows(indices, variants=False)
+            return [store.paths[i] for i in indices], store.labels[originals]
+
+        history = fine_tune(model, backbone, images(train_store, train_idx), images(valid_store, valid_idx),
+                            args.fine_tune_epochs, args.unfreeze, seed=args.seed)
+        print(f"Fine-tuned, validation accuracy {history.history['val_accuracy'][-1]:.4f}")
+
+    model.save(args.output)
+    print(f"Wrote {args.output}; re-run export_disease_model.py to refresh the TFLite/ONNX artifacts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Upload validation and preview thumbnails.
+
+Uploads are rejected before any pixel data is decoded: the byte size is
+checked first, then the format and pixel count are read from the image header
+(PIL's ``Image.open`` is lazy). PIL's own decompression-bomb guard is aligned
+with the same pixel limit. Previews are small JPEG thumbnails, generated once
+per upload and reused across reruns, instead of shipping the full-resolution
+original back to the browser.
+"""
+import hashlib
+import io
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+import preprocessing
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+ALLOWED_FORMATS = {'JPEG', 'PNG'}
+PREVIEW_SIZE = 512
+PREVIEW_CACHE_ENTRIES = 128
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def _image_module():
+    # PIL is imported on first use; its bomb guard is aligned with our pixel limit
+    Image = preprocessing.pil_image()
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image
+
+
+def check_upload(data):
+    """Validate raw upload bytes from the header only; returns (width, height)."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise UploadRejected(f"File is {len(data) / 2**20:.1f} MB; the limit is {MAX_UPLOAD_BYTES / 2**20:.0f} MB")
+    Image = _image_module()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            img = Image.open(io.BytesIO(data))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise UploadRejected(f"Image dimensions are too large; the limit is {MAX_IMAGE_PIXELS / 1e6:.0f} MP") from None
+    except OSError:
+        raise UploadRejected("File is not a supported image") from None
+    if img.format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"Unsupported image format {img.format}; use JPEG or PNG")
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(f"Image is {width * height / 1e6:.0f} MP; the limit is {MAX_IMAGE_PIXELS / 1e6:.0f} MP")
+    return width, height
+
+
+_previews = OrderedDict()
+_previews_lock = threading.Lock()
+
+
+def preview_thumbnail(data, size=PREVIEW_SIZE):
+    """JPEG bytes of a thumbnail no larger than size x size, cached by content hash."""
+    key = (hashlib.sha256(data).hexdigest(), size)
+    with _previews_lock:
+        if key in _previews:
+            _previews.move_to_end(key)
+            return _previews[key]
+
+    img = preprocessing.open_reduced(io.BytesIO(data), size)
+    img.thumbnail((size, size))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=85)
+    thumbnail = out.getvalue()
+
+    with _previews_lock:
+        _previews[key] = thumbnail
+        if len(_previews) > PREVIEW_CACHE_ENTRIES:
+            _previews.popitem(last=False)
+    return thumbnail
@@ -0,0 +1,288 @@
+"""Multi-process inference worker pool for the disease model.
+
+Streamlit serves every session from threads of one process, so image decoding
+and ``model.predict`` calls from concurrent sessions contend for the GIL and
+for TensorFlow's thread pools. The pool moves model execution into worker
+processes: each one pins its intra-/inter-op thread counts before the runtime
+starts and loads its own copy of the model through the model registry (so it
+also picks up a replaced model file).
+
+Images travel through a shared-memory SlotRing (see shared_slots.py): the
+front end decodes each upload straight into a uint8 input slot (PIL releases
+the GIL while decoding), the worker scales the pixels into its own float32
+buffer, predicts and writes the probabilities into the matching output slot.
+Only slot indices and stage timings are pickled.
+
+The ring is also the backpressure: at most ``max_pending`` images may be in
+flight, and a caller that cannot get slots within ``submit_timeout`` seconds
+gets ``PoolBusy`` instead of waiting behind an ever-growing queue.
+
+If a worker process dies (out of memory, a crash in the native runtime), the
+requests it was running fail, and the pool replaces its process pool with a
+fresh one attached to the same ring for the requests that follow.
+
+The pool is off by default; set INFERENCE_WORKERS to the number of processes
+(and optionally INFERENCE_INTRA_OP_THREADS, INFERENCE_INTER_OP_THREADS,
+INFERENCE_MAX_PENDING) to enable it for the UI and the API.
+"""
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import model_registry
+import preprocessing
+from inference import timed_stage
+from shared_slots import SlotRing
+from timing import StageTimer
+
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+DEFAULT_INTER_OP_THREADS = 1
+DEFAULT_MAX_PENDING = 64
+DEFAULT_SUBMIT_TIMEOUT = 5.0
+
+
+class PoolBusy(RuntimeError):
+    pass
+
+
+_worker_model_path = None
+_worker_ring = None
+_worker_buffer = None
+
+
+def _init_worker(model_path, intra_op_threads, inter_op_threads, ring_name, slots, output_dim):
+    # Thread counts must be fixed before TensorFlow (or its lite runtimes) start
+    global _worker_model_path, _worker_ring
+    _worker_model_path = model_path
+    os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+    if not model_path.endswith(('.tflite', '.onnx')):
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    _worker_ring = SlotRing(slots, output_dim, name=ring_name)
+    # Load and warm up now rather than on the first job
+    model_registry.get_disease_model(model_path)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _input_buffer(count):
+    # Worker-local float32 batch, grown to the largest job seen
+    global _worker_buffer
+    if _worker_buffer is None or len(_worker_buffer) < count:
+        _worker_buffer = preprocessing.new_batch(count)
+    return _worker_buffer[:count]
+
+
+def _predict_slots(indices):
+    # Runs in a worker: read pixels from the input slots, write probabilities to the output slots
+    timer = StageTimer('worker')
+    model = model_registry.get_disease_model(_worker_model_path)
+    batch = _input_buffer(len(indices))
+    with timer.stage('normalize'):
+        for row, slot in zip(batch, indices):
+            np.copyto(row, _worker_ring.inputs[slot], casting='unsafe')
+        preprocessing.scale_inplace(batch)
+    with timer.stage('predict'):
+        _worker_ring.outputs[indices] = model.predict(batch, verbose=0)
+    return timer.durations
+
+
+class WorkerPool:
+    def __init__(self, workers, model_path=model_registry.DISEASE_MODEL_PATH, intra_op_threads=None,
+                 inter_op_threads=DEFAULT_INTER_OP_THREADS, max_pending=DEFAULT_MAX_PENDING,
+                 submit_timeout=DEFAULT_SUBMIT_TIMEOUT, decode_threads=None):
+        self.workers = workers
+        self.model_path = model_path
+        self.intra_op_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // workers)
+        self.inter_op_threads = inter_op_threads
+        self.submit_timeout = submit_timeout
+        self._ring = SlotRing(max_pending)
+        self._executor = self._new_executor()
+        self._decoders = ThreadPoolExecutor(decode_threads, thread_name_prefix='slot-decode')
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._version_stat = None
+        self._version = None
+
+    def _new_executor(self):
+        # TensorFlow is not fork-safe, so workers start from a fresh interpreter
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+            initargs=(self.model_path, self.intra_op_threads, self.inter_op_threads,
+                      self._ring.name, self._ring.slots, self._ring.output_dim))
+
+    def _restart(self, broken):
+        """Replace ``broken`` with a fresh process pool, unless another caller already has."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_job(self, fn, *args):
+        executor = self._executor
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor, executor.submit(fn, *args)
+
+    @property
+    def max_pending(self):
+        return self._ring.slots
+
+    def _acquire(self, count):
+        indices = self._ring.acquire(count, timeout=self.submit_timeout)
+        with self._lock:
+            if indices is None:
+                self._rejected += 1
+            else:
+                self._submitted += 1
+        if indices is None:
+            raise PoolBusy(f"All {self.max_pending} inference slots are busy")
+        return indices
+
+    def _submit(self, indices, fill):
+        """Write the inputs into the slots and queue the job.
+
+        Returns a future for (probabilities, worker stage timings). The slots go back
+        to the ring as soon as the worker is done, whether or not anyone is waiting.
+        """
+        result = Future()
+
+        def done(job):
+            try:
+                durations = job.result()
+                result.set_result((self._ring.outputs[indices].copy(), durations))
+            except BaseException as e:
+                if isinstance(e, BrokenProcessPool):
+                    # A worker died: this job fails, later ones get a fresh pool
+                    self._restart(executor)
+                result.set_exception(e)
+            finally:
+                self._ring.release(indices)
+
+        try:
+            fill()
+            executor, job = self._submit_job(_predict_slots, indices)
+        except BaseException:
+            self._ring.release(indices)
+            raise
+        job.add_done_callback(done)
+        return result
+
+    def predict_upload(self, data, timer=None):
+        """Class probabilities for one upload's raw bytes; predicted in a worker."""
+        indices = self._acquire(1)
+
+        def fill():
+            with timed_stage(timer, 'decode'):
+                img = preprocessing.open_reduced(io.BytesIO(data))
+            with timed_stage(timer, 'resize'):
+                preprocessing.resize_into(img, self._ring.inputs[indices[0]])
+
+        future = self._submit(indices, fill)
+        start = time.perf_counter()
+        probs, durations = future.result()
+        if timer is not None:
+            for stage, seconds in durations.items():
+                timer.add(stage, seconds)
+            # Queueing plus the round trip to the worker
+            timer.add('worker queue', max(0.0, time.perf_counter() - start - sum(durations.values())))
+        return probs[0]
+
+    def predict_uploads(self, datas, batch_size):
+        """Probabilities for many uploads, one batch of slots per job, spread across the workers.
+
+        A large request has at most two jobs (half the ring) in flight, collecting its
+        oldest job before decoding the next batch, so it cannot starve other callers.
+        """
+        chunk_size = max(1, min(batch_size, self.max_pending // 4))
+        in_flight = deque()
+        outputs = []
+        for start in range(0, len(datas), chunk_size):
+            if len(in_flight) >= 2:
+                outputs.append(in_flight.popleft().result()[0])
+            chunk = datas[start:start + chunk_size]
+            indices = self._acquire(len(chunk))
+
+            def fill():
+                # Decode straight into the shared input slots; list() surfaces decode errors
+                list(self._decoders.map(
+                    lambda j: preprocessing.load_into(io.BytesIO(chunk[j]), self._ring.inputs[indices[j]]),
+                    range(len(chunk))))
+
+            in_flight.append(self._submit(indices, fill))
+        outputs.extend(f.result()[0] for f in in_flight)
+        if not outputs:
+            return np.empty((0, self._ring.output_dim), dtype=np.float32)
+        return np.concatenate(outputs)
+
+    def warm(self):
+        # Start the worker processes (model load and warm-up) before the first request
+        futures = [self._submit_job(_ready)[1] for _ in range(self.workers)]
+        return sorted({f.result() for f in futures})
+
+    @property
+    def model_version(self):
+        # Same content hash the workers' registries use, without loading the model here
+        st = os.stat(self.model_path)
+        with self._lock:
+            if self._version_stat != (st.st_mtime_ns, st.st_size):
+                self._version = model_registry.file_sha256(self.model_path)[:12]
+                self._version_stat = (st.st_mtime_ns, st.st_size)
+            return self._version
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "intra_op_threads": self.intra_op_threads,
+                "max_pending": self.max_pending,
+                "pending": self.max_pending - self._ring.free_slots,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._decoders.shutdown(wait=True)
+        self._ring.close()
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Process-wide pool configured from the environment, or None when INFERENCE_WORKERS is 0."""
+    global _worker_pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool(
+                INFERENCE_WORKERS,
+                intra_op_threads=int(os.environ.get('INFERENCE_INTRA_OP_THREADS', 0)) or None,
+                inter_op_threads=int(os.environ.get('INFERENCE_INTER_OP_THREADS', DEFAULT_INTER_OP_THREADS)),
+                max_pending=int(os.environ.get('INFERENCE_MAX_PENDING', DEFAULT_MAX_PENDING)))
+            atexit.register(_worker_pool.shutdown)
+        return _worker_pool